@@ -6,13 +6,19 @@ $Id$
 """
 
 
+import sys
+from os.path import dirname, join
+
 import graphication.css as css
 css.install_hook()
-from graphication import default_css
+
+# Load the default stylesheet directly, rather than searching for it
+default_css = css.load_stylesheet(join(dirname(__file__), "default.css"))
+sys.modules["graphication.default_css"] = default_css
 
 from graphication.output import FileOutput
 from graphication.label import Label
-from graphication.series import Series, SeriesSet, Node, NodeSet, NodeLink
+from graphication.series import Series, RingSeries, SeriesSet, Node, NodeSet, NodeLink
 from graphication.scales import SimpleScale, VerticalWavegraphScale
 from graphication.scales.date import DateScale, AutoDateScale, AutoWeekDateScale, WeekdayDateScale
 from graphication.colourer import Colourer
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""
+graphication.arrowfile:
+
+  Reads SeriesSets straight out of Arrow tables and Parquet files.
+
+Tables can either be wide, with a key column and one column per series,
+or long, with a row for each (key, series, value) point. The key and
+value columns are handed to the Series as NumPy arrays over the Arrow
+buffers wherever Arrow allows it, so no Python floats are made.
+
+Needs PyArrow (and so NumPy) installed.
+"""
+
+import time
+import datetime
+
+try:
+	import numpy
+	import pyarrow
+	import pyarrow.parquet
+except ImportError:
+	numpy = pyarrow = None
+
+from graphication.series import Series, SeriesSet, key_to_number
+
+
+# How many of each timestamp unit there are in a second
+UNITS = {"s": 1, "ms": 1000, "us": 1000000, "ns": 1000000000}
+
+
+
+def to_array(column):
+	"""
+	Returns the Arrow column (an Array or ChunkedArray) as a NumPy array.
+	A single chunk without nulls is viewed without copying; several chunks
+	have to be joined together first.
+	"""
+	
+	chunks = getattr(column, "chunks", [column])
+	arrays = []
+	for chunk in chunks:
+		try:
+			arrays.append(chunk.to_numpy(zero_copy_only=True))
+		except (pyarrow.ArrowInvalid, NotImplementedError):
+			arrays.append(chunk.to_numpy(zero_copy_only=False))
+	if len(arrays) == 1:
+		return arrays[0]
+	return numpy.concatenate(arrays)
+
+
+
+def local_seconds(seconds):
+	"""
+	Turns an array of wall-clock times, as seconds since 1970-01-01 00:00,
+	into timestamps the way Series turn dates into them; that is, taking
+	them as local time (see d_to_timestamp). The UTC offset is only worked
+	out once for each distinct hour, rather than for every row.
+	"""
+	
+	hours, inverse = numpy.unique(numpy.floor_divide(seconds, 3600), return_inverse=True)
+	offsets = numpy.array([
+		time.mktime(datetime.datetime.utcfromtimestamp(hour * 3600).timetuple()) - hour * 3600
+		for hour in hours.tolist()
+	], dtype=float)
+	return seconds + offsets[inverse]
+
+
+
+def key_array(column):
+	"""
+	Returns a (keys, key_type) tuple for an Arrow key column. Timestamp and
+	date columns are turned into timestamps the same way Series do with
+	date keys, reading timestamps without a time zone (and dates) as local
+	time, and key_type says which they were; numeric columns are left as
+	they are, with a key_type of None.
+	"""
+	
+	kind = column.type
+	keys = to_array(column)
+	if pyarrow.types.is_timestamp(kind):
+		keys = keys.astype("int64") / float(UNITS[kind.unit])
+		# Zoned timestamps are already real instants
+		if kind.tz is None:
+			keys = local_seconds(keys)
+		return keys, datetime.datetime
+	if pyarrow.types.is_date32(kind):
+		return local_seconds(keys.astype("int64") * 86400.0), datetime.date
+	if pyarrow.types.is_date64(kind):
+		return local_seconds(keys.astype("int64") / 1000.0), datetime.date
+	return keys, None
+
+
+
+def key_bounds(keys, key_range):
+	"""
+	Returns the (lo, hi) row range of the sorted 'keys' that falls within
+	key_range, a (start, end) tuple whose ends are inclusive and can be None.
+	"""
+	
+	if key_range is None:
+		return 0, len(keys)
+	start, end = key_range
+	lo, hi = 0, len(keys)
+	if start is not None:
+		lo = keys.searchsorted(key_to_number(start), "left")
+	if end is not None:
+		hi = keys.searchsorted(key_to_number(end), "right")
+	return lo, hi
+
+
+
+def make_series(title, keys, values, key_type):
+	"""Makes a Series backed by the given NumPy key and value columns."""
+	
+	series = Series(title, {})
+	if len(values):
+		series.set_columns(keys, values, (values.min(), values.max()), values.sum())
+	else:
+		series.set_columns(keys, values)
+	series.key_type = key_type
+	return series
+
+
+
+def from_table(table, key="key", columns=None, key_range=None):
+	"""
+	Creates a SeriesSet from a wide Arrow table, with one column of keys
+	and a column for each series, titled with the column's name.
+	
+	@param table: The table to read
+	@type table: pyarrow.Table
+	@param key: The name of the key column
+	@type key: str
+	@param columns: The names of the columns to make series of; defaults to all of them
+	@type columns: list
+	@param key_range: Only read rows with keys between (start, end), inclusive
+	@type key_range: tuple
+	@rtype: graphication.series.SeriesSet
+	"""
+	
+	assert pyarrow is not None, "You need PyArrow installed to read Arrow tables."
+	
+	if columns is None:
+		columns = [name for name in table.schema.names if name != key]
+	
+	keys, key_type = key_array(table.column(key))
+	if len(keys) > 1 and (keys[1:] <= keys[:-1]).any():
+		# Keys must be increasing to be used as a column; sort the rows
+		order = numpy.argsort(keys, kind="mergesort")
+		keys = keys[order]
+		table = table.take(pyarrow.array(order))
+	
+	# Cut down to the row range; slicing Arrow tables doesn't copy
+	lo, hi = key_bounds(keys, key_range)
+	keys = keys[lo:hi]
+	table = table.slice(lo, hi - lo)
+	
+	series_set = SeriesSet()
+	for name in columns:
+		series_set.add_series(make_series(name, keys, to_array(table.column(name)), key_type))
+	return series_set
+
+
+
+def from_long_table(table, key="key", series="series", value="value", columns=None, key_range=None):
+	"""
+	Creates a SeriesSet from a long Arrow table, with a row for each point
+	giving its key, the title of its series, and its value. Each series'
+	points are gathered together, so their values are copied once.
+	
+	@param table: The table to read
+	@type table: pyarrow.Table
+	@param key: The name of the key column
+	@param series: The name of the column of series titles
+	@param value: The name of the value column
+	@param columns: The titles of the series to read; defaults to all of them
+	@type columns: list
+	@param key_range: Only read points with keys between (start, end), inclusive
+	@type key_range: tuple
+	@rtype: graphication.series.SeriesSet
+	"""
+	
+	assert pyarrow is not None, "You need PyArrow installed to read Arrow tables."
+	
+	keys, key_type = key_array(table.column(key))
+	values = to_array(table.column(value))
+	
+	# Number the series, so titles aren't compared row by row
+	titles = table.column(series)
+	if hasattr(titles, "chunks"):
+		titles = pyarrow.concat_arrays(titles.chunks)
+	titles = titles.dictionary_encode()
+	codes = titles.indices.to_numpy()
+	names = titles.dictionary.to_pylist()
+	
+	# Pick out the rows we want
+	mask = numpy.ones(len(keys), dtype=bool)
+	if key_range is not None:
+		start, end = key_range
+		if start is not None:
+			mask &= keys >= key_to_number(start)
+		if end is not None:
+			mask &= keys <= key_to_number(end)
+	if columns is not None:
+		wanted = [i for i, name in enumerate(names) if name in columns]
+		mask &= numpy.in1d(codes, wanted)
+	rows = numpy.nonzero(mask)[0]
+	
+	# Sort by series, then key, and split into one run per series
+	order = rows[numpy.lexsort((keys[rows], codes[rows]))]
+	codes = codes[order]
+	keys = keys[order]
+	values = values[order]
+	bounds = numpy.searchsorted(codes, numpy.arange(len(names) + 1))
+	
+	series_set = SeriesSet()
+	for i, name in enumerate(names):
+		lo, hi = bounds[i], bounds[i+1]
+		if hi > lo:
+			series_set.add_series(make_series(name, keys[lo:hi], values[lo:hi], key_type))
+	return series_set
+
+
+
+def overlapping_row_groups(metadata, key, key_range):
+	"""
+	Returns the indexes of the row groups in the Parquet metadata whose
+	'key' column might have values within key_range, going by the row
+	groups' statistics. Row groups without statistics are always included.
+	"""
+	
+	start, end = key_range
+	row_groups = []
+	for i in range(metadata.num_row_groups):
+		row_group = metadata.row_group(i)
+		statistics = None
+		for j in range(row_group.num_columns):
+			column = row_group.column(j)
+			if column.path_in_schema == key:
+				statistics = column.statistics
+				break
+		if statistics is not None and statistics.has_min_max:
+			if start is not None and statistics.max < start:
+				continue
+			if end is not None and statistics.min > end:
+				continue
+		row_groups.append(i)
+	return row_groups
+
+
+
+def read_parquet(filename, key="key", columns=None, key_range=None, long=False, series="series", value="value"):
+	"""
+	Reads a SeriesSet from a Parquet file, in either the wide or the long
+	layout (see from_table and from_long_table). Only the columns needed
+	are read, and for numeric keys, the key range is also used to skip row
+	groups that can't hold any of it.
+	
+	@param filename: The file to read
+	@type filename: str
+	@param long: If the file is in the long (key, series, value) layout
+	@type long: bool
+	@rtype: graphication.series.SeriesSet
+	"""
+	
+	assert pyarrow is not None, "You need PyArrow installed to read Parquet files."
+	
+	if long:
+		projection = [key, series, value]
+	elif columns is not None:
+		projection = [key] + list(columns)
+	else:
+		projection = None
+	
+	# The key range is cut out after reading (see key_bounds); for numeric
+	# keys, row groups whose statistics fall outside it aren't read at all
+	parquet_file = pyarrow.parquet.ParquetFile(filename)
+	row_groups = None
+	if key_range is not None:
+		schema = parquet_file.schema.to_arrow_schema()
+		kind = schema[schema.get_field_index(key)].type
+		if pyarrow.types.is_integer(kind) or pyarrow.types.is_floating(kind):
+			row_groups = overlapping_row_groups(parquet_file.metadata, key, key_range)
+	
+	if row_groups is None:
+		table = parquet_file.read(columns=projection)
+	else:
+		table = parquet_file.read_row_groups(row_groups, columns=projection)
+	if long:
+		return from_long_table(table, key, series, value, columns, key_range)
+	return from_table(table, key, columns, key_range)
@@ -15,10 +15,21 @@ $Id$
 """
 
 import re
+import hashlib
+import cPickle
+import weakref
 from UserDict import UserDict
 
 import sys, os
-from os.path import isdir, join, exists, abspath
+from os.path import isdir, join, exists, abspath, expanduser, getmtime, getsize
+
+# Bump this whenever the pickled form of stylesheets changes
+COMPILED_VERSION = 2
+
+# The tokens load_css splits stylesheets into; whitespace, then either an
+# @-rule ('@import name;') or a rule ('selector { declarations }')
+css_comment = re.compile(r"/\*.*?(\*/|$)", re.S)
+css_token = re.compile(r"\s*(?:@\S*\s+(?P<import>[^;]*);|(?P<selector>[^{@]*)\{(?P<body>[^}]*)\})")
 
 def selector_split(string, single_class=True):
 	
@@ -68,6 +79,20 @@ def selector_split(string, single_class=True):
 
 
 
+def element_key(element):
+	
+	"""
+	Turns an element-list into something hashable, for caching computed
+	styles. Classes are sorted, as their order doesn't affect matching.
+	
+	@param element: An element-list of (tag, id, [classes]) tuples
+	@type element: list
+	"""
+	
+	return tuple([(tag, id, tuple(sorted(clss))) for tag, id, clss in element])
+
+
+
 def hex_to_rgba(color):
 	
 	"""
@@ -186,18 +211,20 @@ class CssSelector(object):
 		@type element_rep: list
 		"""
 		
-		di = 0
+		details = self.details
+		if not details:
+			return True
 		
+		di = 0
+		tag, id_, cls = details[0]
 		for element, id, clss in element_rep:
-			curr_det = self.details[di]
-			if curr_det[0] in [element, None]:
-				if curr_det[1] in [id, None]:
-					if curr_det[2] in clss + [None]:
-						di += 1
-						if di >= len(self.details):
-							return True
+			if (tag is None or tag == element) and (id_ is None or id_ == id) and (cls is None or cls in clss):
+				di += 1
+				if di >= len(details):
+					return True
+				tag, id_, cls = details[di]
 		
-		return di >= len(self.details)
+		return False
 
 
 
@@ -436,6 +463,77 @@ class CssProperties(UserDict):
 
 
 
+def collapse_rules(rules):
+	
+	"""
+	Sorts the rules by specificity, and folds together rules with identical
+	selectors, without changing the properties any element ends up with.
+	An earlier rule loses the properties a later one with the same selector
+	overrides, and what's left of it moves into the later rule, unless a
+	rule in between sets any of those properties too.
+	
+	@param rules: The rules to collapse; they aren't changed.
+	@type rules: list of CssRule
+	"""
+	
+	rules = sorted(rules, key=lambda r: r.selector.specificity)
+	result = []
+	positions = {}
+	for rule in rules:
+		key = tuple(rule.selector.details)
+		i = positions.get(key)
+		if i is not None:
+			earlier = result[i]
+			remaining = dict([
+				(name, value)
+				for name, value in earlier.properties.items()
+				if name not in rule.properties
+			])
+			result[i] = None
+			if remaining:
+				clashes = [
+					between for between in result[i+1:]
+					if between is not None and [name for name in remaining if name in between.properties]
+				]
+				if clashes:
+					result[i] = CssRule(earlier.selector, remaining)
+				else:
+					remaining.update(rule.properties)
+					rule = CssRule(rule.selector, remaining)
+		positions[key] = len(result)
+		result.append(rule)
+	return [rule for rule in result if rule is not None]
+
+
+
+class FrozenCssProperties(CssProperties):
+	
+	"""
+	CssProperties that can't be changed. Stylesheets cache the properties
+	they compute and hand the same ones out again, so they come frozen;
+	use copy() to get a changeable CssProperties.
+	"""
+	
+	def __init__(self, properties, stylesheet, root):
+		self.data = properties
+		self.stylesheet = stylesheet
+		self.root = root
+	
+	
+	def _frozen(self, *args, **kwargs):
+		raise TypeError("These properties are shared by the stylesheet's cache; copy() them first.")
+	
+	__setitem__ = __delitem__ = clear = update = setdefault = pop = popitem = _frozen
+	
+	
+	def copy(self):
+		props = CssProperties(self.data)
+		props.stylesheet = self.stylesheet
+		props.root = self.root
+		return props
+
+
+
 class CssStylesheet(object):
 	
 	"""
@@ -450,6 +548,75 @@ class CssStylesheet(object):
 		"""
 		
 		self.rules = []
+		self.sources = []
+		self.version = 0
+		self.rules_changed()
+	
+	
+	def rules_changed(self):
+		"""
+		Drops the computed properties, the rule index and the merged
+		stylesheets, which are all worked out from the rules. Call this if
+		you change the rules list yourself; the methods that change it
+		already do.
+		"""
+		
+		self.computed = {}
+		self.index = None
+		self.merged = weakref.WeakKeyDictionary()
+		self.frozen = None
+		self.version += 1
+	
+	
+	def build_index(self):
+		"""
+		Sorts the rules into buckets by the last part of their selector;
+		by its id, or failing that its class, or failing that its tag.
+		A rule can only match an element-list with an element in its bucket,
+		so get_properties only has to try those rules.
+		"""
+		
+		index = {}
+		for position, rule in enumerate(self.rules):
+			if rule.selector.details:
+				tag, id, cls = rule.selector.details[-1]
+			else:
+				tag = id = cls = None
+			if id is not None:
+				key = ("#", id)
+			elif cls is not None:
+				key = (".", cls)
+			elif tag is not None:
+				key = ("", tag)
+			else:
+				key = None
+			index.setdefault(key, []).append(position)
+		self.index = index
+	
+	
+	def candidate_rules(self, element):
+		"""
+		Returns the rules that might match the element-list 'element',
+		in order of specificity, using the rule index (see build_index).
+		
+		@param element: An element-list of (tag, id, [classes]) tuples
+		@type element: list
+		"""
+		
+		if self.index is None:
+			self.build_index()
+		index = self.index
+		
+		positions = set(index.get(None, ()))
+		for tag, id, clss in element:
+			positions.update(index.get(("", tag), ()))
+			if id is not None:
+				positions.update(index.get(("#", id), ()))
+			for cls in clss:
+				positions.update(index.get((".", cls), ()))
+		
+		rules = self.rules
+		return [rules[position] for position in sorted(positions)]
 	
 	
 	def add_rule(self, rule):
@@ -460,14 +627,53 @@ class CssStylesheet(object):
 		@type rule: CssRule
 		"""
 		
-		self.rules.append(rule)
-		self.rules.sort(key=lambda r: r.selector.specificity)
+		self.rules.insert(self.rule_position(rule), rule)
+		self.rules_changed()
+	
+	
+	def rule_position(self, rule):
+		"""
+		Returns the index the rule should be inserted at to keep the rules
+		in order of specificity; that's after any rules that are just as
+		specific, so later rules still win.
+		
+		@param rule: The rule to find a place for.
+		@type rule: CssRule
+		"""
+		
+		specificity = rule.selector.specificity
+		rules = self.rules
+		lo, hi = 0, len(rules)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if specificity < rules[mid].selector.specificity:
+				hi = mid
+			else:
+				lo = mid + 1
+		return lo
+	
+	
+	def add_rules(self, rules):
+		"""
+		Adds several rules to the CssStylesheet at once, sorting them in
+		just once; they end up the same as if add_rule was called on each.
+		
+		@param rules: The rules to add.
+		@type rules: list of CssRule
+		"""
+		
+		if rules:
+			self.rules.extend(rules)
+			self.rules.sort(key=lambda r: r.selector.specificity)
+			self.rules_changed()
 	
 	
 	def get_properties(self, element):
 		
 		"""
 		Returns the properties for the element 'element'.
+		These are cached until the rules change, so they're frozen (see
+		FrozenCssProperties).
 		
 		@param element: An element-list of (tag, id, [classes]) tuples
 		@type element: list
@@ -477,17 +683,21 @@ class CssStylesheet(object):
 		if not element:
 			return {}
 		
+		key = element_key(element)
+		try:
+			return self.computed[key]
+		except KeyError:
+			pass
+		
 		# Recurse to get inherited properties
-		properties = self.get_properties(element[:-1])
+		properties = dict(self.get_properties(element[:-1]))
 		
-		# Find matching rules (they're already in order of specificity)
-		for rule in self.rules:
+		# Find matching rules (they come in order of specificity)
+		for rule in self.candidate_rules(element):
 			if rule.selector.matches(element):
 				properties.update(rule.properties)
 		
-		props = CssProperties(properties)
-		props.stylesheet = self
-		props.root = element
+		props = self.computed[key] = FrozenCssProperties(properties, self, list(element))
 		return props
 	
 	
@@ -515,24 +725,39 @@ class CssStylesheet(object):
 		Merges this stylesheet with the other one, with the other
 		stylesheet's rules taking preference.
 		
-		Returns the resulting merged stylesheet.
+		Returns the resulting merged stylesheet, frozen (see
+		FrozenCssStylesheet). It's remembered, and handed out again for
+		the same two stylesheets while neither of them changes, for as long
+		as the other stylesheet is around.
 		
 		Note: DOES NOT update this stylesheet.
 		
-		If the stylesheet parameter is None, returns a copy of this stylesheet.
+		If the stylesheet parameter is None, returns a frozen copy of this
+		stylesheet.
 		
 		@param stylesheet: The stylesheet to update from.
 		@type stylesheet: CssStylesheet
 		"""
 		
-		# TODO: A more sophisticated update that removes duplicates.
-		new_stylesheet = CssStylesheet()
 		if stylesheet is None:
-			new_stylesheet.rules = self.rules + []
-		else:
-			new_stylesheet.rules = self.rules + stylesheet.rules
-		new_stylesheet.rules.sort(key=lambda r: r.selector.specificity)
-		return new_stylesheet
+			if self.frozen is None:
+				self.frozen = FrozenCssStylesheet(self.rules, self.sources)
+			return self.frozen
+		
+		# Have we made this one before?
+		try:
+			other_version, merged = self.merged[stylesheet]
+			if other_version == stylesheet.version:
+				return merged
+		except KeyError:
+			pass
+		
+		merged = FrozenCssStylesheet(
+			collapse_rules(list(self.rules) + list(stylesheet.rules)),
+			list(self.sources) + list(stylesheet.sources),
+		)
+		self.merged[stylesheet] = (stylesheet.version, merged)
+		return merged
 	
 	
 	def imerge(self, stylesheet=None):
@@ -544,12 +769,33 @@ class CssStylesheet(object):
 		@type stylesheet: CssStylesheet
 		"""
 		
-		# TODO: A more sophisticated update that removes duplicates.
 		if stylesheet is None:
 			return
 		else:
-			self.rules = self.rules + stylesheet.rules
-		self.rules.sort(key=lambda r: r.selector.specificity)
+			self.rules = collapse_rules(self.rules + list(stylesheet.rules))
+			self.sources = self.sources + list(stylesheet.sources)
+		self.rules_changed()
+	
+	
+	def copy(self):
+		"""Returns a changeable copy of this stylesheet."""
+		
+		stylesheet = CssStylesheet()
+		stylesheet.rules = list(self.rules)
+		stylesheet.sources = list(self.sources)
+		stylesheet.rules_changed()
+		return stylesheet
+	
+	
+	def __getstate__(self):
+		# The computed properties and index are quicker to rebuild than load
+		return {"rules": self.rules, "sources": self.sources}
+	
+	
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.version = 0
+		self.rules_changed()
 	
 	
 	def __repr__(self):
@@ -582,84 +828,73 @@ class CssStylesheet(object):
 		@type css: str
 		"""
 		
-		# Initialise loop vars
-		in_comment = in_declaration = in_import = False
-		buffer = ""
-		key = value = None
+		self.rules_changed()
 		
-		# Read the css one character at a time
-		while css:
-			buffer += css[0]
-			css = css[1:]
+		# Comments can go anywhere, so take them all out first
+		css = css_comment.sub(" ", css)
+		
+		rules = []
+		pos = 0
+		while True:
+			match = css_token.match(css, pos)
+			if match is None:
+				break
+			pos = match.end()
+			name, selector, body = match.group("import", "selector", "body")
 			
-			# If we're not in a comment, do stuff
-			if not in_comment:
-				
-				# Start a comment?
-				if buffer[-2:] == "/*":
-					in_comment = True
-				
-				# We might be outside a declaratin...
-				elif not in_declaration:
-					
-					# Are we starting a declaration?
-					if buffer[-1] == "{":
-						selector = buffer[:-1].strip()
-						properties = {}
-						buffer = ""
-						in_declaration = True
-					
-					# Or perhaps an import?
-					elif buffer[-1] == "@":
-						buffer = ""
-						in_import = 1
-					
-					elif in_import == 1:
-						if buffer[-1] == " ":
-							buffer = ""
-							in_import = 2 # We're reading the RHS now
-					
-					elif in_import == 2:
-						if buffer[-1] == ";":
-							# Load the given CSS file, and merge it
-							tomerge = __import__(buffer[:-1]+"_css", {}, {}, ['s'])
-							self.imerge(tomerge)
-							buffer = ""
-							in_import = False
-				
-				# ...or outside one...
-				elif in_declaration:
-					
-					# Are we ending here?
-					if buffer[-1] == "}":
-						value = buffer[:-1].strip()
-						if key:
-							properties[key] = value
-						self.add_rule(CssRule(selector, properties))
-						buffer = ""
-						key = value = None
-						in_declaration = False
-					
-					# Moving from a key to a value?
-					elif buffer[-1] == ":":
-						key = buffer[:-1].strip()
-						buffer = ""
-					
-					# Ending a property?
-					elif buffer[-1] == ";":
-						value = buffer[:-1].strip()
-						properties[key] = value
-						buffer = ""
-						key = value = None
+			# Load the given CSS file, and merge it in after what we have so far
+			if name is not None:
+				self.add_rules(rules)
+				rules = []
+				tomerge = __import__(name.strip().strip("\"'")+"_css", {}, {}, ['s'])
+				self.imerge(tomerge)
 			
-			# All we can do is exit a comment.
 			else:
-				if buffer[-2:] == "*/":
-					in_comment = False
-					buffer = ""
+				properties = {}
+				for declaration in body.split(";"):
+					key, colon, value = declaration.partition(":")
+					key = key.strip()
+					if colon and key:
+						properties[key] = value.strip()
+				rules.append(CssRule(selector.strip(), properties))
+		
+		self.add_rules(rules)
 
 
 
+class FrozenCssStylesheet(CssStylesheet):
+	
+	"""
+	A CssStylesheet that can't be changed. merge() hands the same merged
+	stylesheet out to everything that asks for it, so it comes frozen;
+	use copy() to get a changeable CssStylesheet.
+	"""
+	
+	def __init__(self, rules, sources):
+		self.rules = tuple(rules)
+		self.sources = tuple(sources)
+		self.version = 0
+		self.rules_changed()
+	
+	
+	def _frozen(self, *args, **kwargs):
+		raise TypeError("This stylesheet is shared by merge()'s cache; copy() it first.")
+	
+	add_rule = add_rules = imerge = load_css = _frozen
+	
+	
+	def merge(self, stylesheet=None):
+		if stylesheet is None:
+			return self
+		return CssStylesheet.merge(self, stylesheet)
+	
+	
+	def __setstate__(self, state):
+		CssStylesheet.__setstate__(self, state)
+		self.rules = tuple(self.rules)
+		self.sources = tuple(self.sources)
+
+
 class CssImporter(object):
 	
 	"""
@@ -670,9 +905,12 @@ class CssImporter(object):
 	
 	def find_module(self, fullname, path=None):
 		
+		# Only look for modules named like stylesheets, so that every
+		# other import doesn't have to search the whole path as well
 		name = fullname.split('.')[-1]
-		if name[-4:] == "_css":
-			name = name[:-4]
+		if name[-4:] != "_css":
+			return None
+		name = name[:-4]
 		
 		# Get our paths
 		paths = sys.path
@@ -694,7 +932,7 @@ class CssImporter(object):
 	
 	
 	def load_module(self, fullname):
-		stylesheet = CssStylesheet.from_css(open(self.filename).read())
+		stylesheet = load_stylesheet(self.filename)
 		return stylesheet
 	
 	
@@ -714,4 +952,132 @@ class CssImporter(object):
 
 def install_hook():
 	"""Installs the import hook."""
-	CssImporter.install()
\ No newline at end of file
+	CssImporter.install()
+
+
+
+def source_state(filename):
+	"""Returns what a compiled stylesheet remembers about a source file."""
+	return (filename, getmtime(filename), getsize(filename))
+
+
+
+def cache_directory():
+	"""
+	Returns the directory compiled stylesheets are kept in; that's
+	$GRAPHICATION_CACHE if it's set, or a 'graphication' directory in the
+	user's cache directory otherwise. (Not next to the CSS files, which
+	may well be somewhere read-only, like site-packages.)
+	"""
+	
+	if os.environ.get("GRAPHICATION_CACHE"):
+		return os.environ["GRAPHICATION_CACHE"]
+	return join(os.environ.get("XDG_CACHE_HOME") or expanduser("~/.cache"), "graphication")
+
+
+
+def compiled_global(module, name):
+	"""
+	Only lets compiled stylesheets contain the classes stylesheets are
+	made of, so a doctored one can't run anything when it's loaded.
+	"""
+	
+	if module == __name__ and name in ["CssStylesheet", "CssRule", "CssSelector"]:
+		return globals()[name]
+	raise cPickle.UnpicklingError("Compiled stylesheets can't contain %s.%s" % (module, name))
+
+
+
+def load_compiled(compiled, path):
+	"""
+	Returns the stylesheet compiled for 'path' in the file 'compiled',
+	or None if it's missing, for a different version or file, out of date
+	(by the modification time and size of any of its sources), or broken.
+	The sources are checked before the stylesheet itself is unpickled.
+	"""
+	
+	try:
+		fo = open(compiled, "rb")
+		try:
+			unpickler = cPickle.Unpickler(fo)
+			unpickler.find_global = compiled_global
+			version, source, sources = unpickler.load()
+			if version != COMPILED_VERSION or source != path:
+				return None
+			if [source_state(state[0]) for state in sources] != list(sources):
+				return None
+			stylesheet = unpickler.load()
+		finally:
+			fo.close()
+	except Exception:
+		# Missing or broken compiled copies just mean parsing again
+		return None
+	if not isinstance(stylesheet, CssStylesheet) or list(stylesheet.sources) != list(sources):
+		return None
+	return stylesheet
+
+
+
+def encode_path(path):
+	"""
+	Returns the path as a byte string, as it's named on disk; unicode
+	paths are encoded with the filesystem encoding (or UTF-8, if they
+	can't be).
+	"""
+	
+	if not isinstance(path, unicode):
+		return path
+	try:
+		return path.encode(sys.getfilesystemencoding() or "utf-8")
+	except UnicodeError:
+		return path.encode("utf-8")
+
+
+
+def load_stylesheet(path, cache_dir=None):
+	
+	"""
+	Loads the CSS file at 'path' as a CssStylesheet. The parsed rules are
+	kept in a compiled copy in the cache directory (see cache_directory),
+	which is used instead of parsing while neither the file nor anything
+	it imports has changed. If the compiled copy can't be written, the
+	file is just parsed each time.
+	
+	@param path: The CSS file to load.
+	@type path: str
+	@param cache_dir: Where to keep the compiled copy; defaults to cache_directory()
+	@type cache_dir: str
+	"""
+	
+	path = abspath(path)
+	if cache_dir is None:
+		cache_dir = cache_directory()
+	name = os.path.splitext(os.path.basename(path))[0]
+	digest = hashlib.md5(encode_path(path)).hexdigest()
+	compiled = join(cache_dir, "%s-%s.cssc" % (name, digest))
+	
+	stylesheet = load_compiled(compiled, path)
+	if stylesheet is not None:
+		return stylesheet
+	
+	stylesheet = CssStylesheet()
+	stylesheet.sources.append(source_state(path))
+	stylesheet.load_css(open(path).read())
+	
+	# Write it somewhere private first, so nobody reads a half-written file
+	temporary = "%s.%i" % (compiled, os.getpid())
+	try:
+		if not isdir(cache_dir):
+			os.makedirs(cache_dir)
+		fo = open(temporary, "wb")
+		try:
+			cPickle.dump((COMPILED_VERSION, path, stylesheet.sources), fo, cPickle.HIGHEST_PROTOCOL)
+			cPickle.dump(stylesheet, fo, cPickle.HIGHEST_PROTOCOL)
+		finally:
+			fo.close()
+		os.rename(temporary, compiled)
+	except (IOError, OSError):
+		if exists(temporary):
+			os.remove(temporary)
+	
+	return stylesheet
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+
+"""
+Times stylesheet lookups against stylesheet size, with and without the
+rule index. Each lookup skips the computed-style cache, so this measures
+the rule matching itself; the stylesheets are default.css plus a number
+of generated themed rules.
+"""
+
+import os
+import time
+import random
+from graphication.css import CssStylesheet, CssRule, selector_split
+
+# Element paths like the ones charts ask for
+paths = [
+	"linegraph grid.major line",
+	"linegraph grid#x.minor label",
+	"wavegraph label",
+	"barchart bar",
+	"linegraph grid.major label",
+	"wavegraph curve.hover",
+]
+elements = [selector_split(path, False) for path in paths]
+
+tags = ["linegraph", "wavegraph", "barchart", "grid", "label", "line", "bar", "curve", "legend", "theme"]
+classes = ["major", "minor", "first", "last", "hover", "highlight"]
+
+def themed_rules(n):
+	"Generates n rules of the sort a big theme would have."
+	random.seed(n)
+	rules = []
+	for i in range(n):
+		parts = []
+		for j in range(random.randint(1, 3)):
+			part = random.choice(tags + ["series%i" % i])
+			if random.random() < 0.4:
+				part += "." + random.choice(classes + ["variant%i" % i])
+			parts.append(part)
+		rules.append(CssRule(" ".join(parts), {"color": "#%06x" % random.randint(0, 0xffffff)}))
+	return rules
+
+def time_lookups(stylesheet, find_rules, repeat=200):
+	"Returns the average time, in microseconds, to match rules for every path."
+	start = time.time()
+	for i in range(repeat):
+		for element in elements:
+			for rule in find_rules(element):
+				rule.selector.matches(element)
+	return (time.time() - start) / (repeat * len(elements)) * 1000000
+
+default_css = open(os.path.join(os.path.dirname(__file__), "..", "default.css")).read()
+
+print "%8s %14s %14s" % ("rules", "linear (us)", "indexed (us)")
+for n in [0, 100, 1000, 5000]:
+	stylesheet = CssStylesheet.from_css(default_css)
+	stylesheet.rules += themed_rules(n)
+	stylesheet.rules.sort(key=lambda r: r.selector.specificity)
+	stylesheet.rules_changed()
+	linear = time_lookups(stylesheet, lambda element: stylesheet.rules)
+	indexed = time_lookups(stylesheet, stylesheet.candidate_rules)
+	print "%8i %14.1f %14.1f" % (len(stylesheet.rules), linear, indexed)
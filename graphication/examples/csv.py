@@ -1,11 +1,8 @@
 #!/usr/bin/python
 
 import sys
-import random
-from graphication.output import FileOutput
+from graphication import FileOutput, SeriesSet, Label, SimpleScale
 from graphication.wavegraph import WaveGraph
-from graphication.label import Label
-from graphication.series import MultiSeries, SubSeries
 
 
 class ColourLoop(object):
@@ -19,40 +16,24 @@ class ColourLoop(object):
 		return self.colours[-1]
 
 
-# Read in the data
+# Read in the data; the first column holds the keys, the rest are series
 filename = sys.argv[1]
-fo = open(filename)
-labels = [x.strip() for x in fo.readline().split(",")]
-data = []
-for line in fo:
-	data.append([int(x.strip()) for x in line.split(",")])
-
-mseries = MultiSeries(range(len(data)))
-series = zip(*data)
-colours = ColourLoop(["#336699", "#669933", "#993366", "#996633"])
-
-for i in range(len(labels)):
-	label = labels[i]
-	mseries.add_series(SubSeries(label, series[i], colours.pop()))
-
-# Initialise our Style
-from graphication.style import Style
-style = Style()
-style['wavegraph:dimming_top'] = 20
-style['label:align'] = "left"
-style['label:color'] = "#222"
-style['default:font'] = "NeoSansLight"
-style['label:font'] = "NeoSansNormal"
+series_set = SeriesSet.from_csv(filename)
+
+colours = ColourLoop(["336699", "669933", "993366", "996633"])
+for series in series_set:
+	series.color = colours.pop()
 
 # Create the output
-output = FileOutput(style)
+output = FileOutput()
 
-# We'll have major lines every integer, and minor ones every half
-labels = dict([(x, str(x)) for x in range(len(data))])
+# We'll have major lines every integer
+key_min, key_max = series_set.key_range()
+scale = SimpleScale(key_min, key_max, 1)
 
 # OK, render that.
-wg = WaveGraph(mseries, style, labels, True)
-lb = Label(filename, style)
+wg = WaveGraph(series_set, scale, None, True)
+lb = Label(filename, None)
 
 output.add_item(lb, x=10, y=5, width=490, height=20)
 output.add_item(wg, x=0, y=30, width=500, height=200)
@@ -60,4 +41,4 @@ output.add_item(wg, x=0, y=30, width=500, height=200)
 # Save the images
 output.write("svg", "%s.svg" % filename)
 output.write("png", "%s.png" % filename)
-output.write("pdf", "%s.pdf" % filename)
\ No newline at end of file
+output.write("pdf", "%s.pdf" % filename)
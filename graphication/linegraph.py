@@ -6,7 +6,7 @@ from graphication.scales import SimpleScale, VerticalWavegraphScale, BaseScale
 
 class LineGraph(object):
 	
-	def __init__(self, series_set, scale, style=None, vertical_scale=True, zero_base=True, smoothed=True, bottom_scale=False, no_bottom_labels=False, vertical_label="", peak_highlight=None, two_passes=False):
+	def __init__(self, series_set, scale, style=None, vertical_scale=True, zero_base=True, smoothed=True, bottom_scale=False, no_bottom_labels=False, vertical_label="", peak_highlight=None, two_passes=False, downsample="minmax", executor=None):
 		
 		"""
 		Constructor; creates a new LineGraph.
@@ -22,6 +22,11 @@ class LineGraph(object):
 		
 		@param smoothed: If the graph is smoothed (not straight lines)
 		@type smoothed: bool
+		
+		@param downsample: How to thin out series with more points than the graph has pixels; 'minmax', 'lttb', or None to always draw every point.
+		@type downsample: str
+		
+		@param executor: A pool (anything with a map method) to prepare the series on in parallel; see SeriesSet.prepare.
 		"""
 		
 		self.series_set = series_set
@@ -34,6 +39,8 @@ class LineGraph(object):
 		self.vertical_label = vertical_label
 		self.peak_highlight = peak_highlight
 		self.two_passes = two_passes
+		self.downsample = downsample
+		self.executor = executor
 		self.first_pass = False
 		
 		self.calc_rel_points()
@@ -43,6 +50,11 @@ class LineGraph(object):
 		
 		"""Calculates the relative shapes of the sections"""
 		
+		self.data_version = self.series_set.version
+		
+		if self.executor is not None:
+			self.series_set.prepare(self.executor, interpolate=False)
+		
 		if isinstance(self.vertical_scale, BaseScale):
 			self.y_scale = self.vertical_scale
 		else:
@@ -54,9 +66,27 @@ class LineGraph(object):
 	
 	
 	def set_size(self, width, height):
+		# Catch up with any points appended since we were created
+		if self.series_set.version != self.data_version:
+			self.calc_rel_points()
 		self.width = width
 		self.height = height
 		self.calc_plot_height()
+		self.calc_drawn_series()
+	
+	
+	def calc_drawn_series(self):
+		
+		"""Works out the series to actually draw, downsampling any that have more points than we have pixels."""
+		
+		if self.executor is not None and self.downsample:
+			self.series_set.prepare(self.executor, interpolate=False, downsample=(int(self.width), self.downsample, self.scale))
+		
+		self.drawn_series = []
+		for series in self.series_set:
+			if self.downsample and len(series) > self.width * 2:
+				series = series.downsample(int(self.width), self.downsample, self.scale)
+			self.drawn_series.append(series)
 	
 	
 	def get_vertical_scale(self):
@@ -155,11 +185,10 @@ class LineGraph(object):
 		smooth = self.style['linegraph line'].get_float("smoothness", 0.5)
 		y_size = self.style['linegraph'].get_align("height", 1)
 		
-		for series in self.series_set:
+		for series in self.drawn_series:
 			
 			# Get the line's points
 			points = [(self.scale.get_point(x)*self.width, (1-(self.y_scale.get_point(y)*y_size))*self.plot_height) for x, y in series.items()]
-			xs = [self.scale.get_value(self.scale.get_point(x)) for x,y in series.items()]
 			
 			# Get style infos
 			line_style = self.style['linegraph line']
@@ -252,32 +281,25 @@ class LineGraph(object):
 				
 				context.stroke()
 			
-			# Draw the line
-			prev_style = series.style_at(0)
+			# Draw the line, one style run at a time
 			last_change = 0
-			context.move_to(*points[0])
-			for j in range(1, len(points)):
-				# Get the drawstyle for this coord
-				draw_style = series.style_at(xs[j])
-				
-				ox, oy = points[j-1]
-				nx, ny = points[j]
-				
-				dx = (nx - ox) * smooth
-				if self.smoothed:
-					context.curve_to(ox+dx, oy, nx-dx, ny, nx, ny)
-				else:
-					context.line_to(nx, ny)
+			for start, end, prev_style in series.style_runs():
+				# Each run carries on up to the first point of the next one
+				end = min(end + 1, len(points))
+				context.move_to(*points[start])
+				for j in range(start + 1, end):
+					ox, oy = points[j-1]
+					nx, ny = points[j]
+					
+					dx = (nx - ox) * smooth
+					if self.smoothed:
+						context.curve_to(ox+dx, oy, nx-dx, ny, nx, ny)
+					else:
+						context.line_to(nx, ny)
 				
-				# If we have a new draw style, we need to end this segment and begin another
-				if draw_style != prev_style:
-					stroke(nx, last_change)
-					prev_style = draw_style
-					context.move_to(*points[j])
-					last_change = nx
-			
-			# Now close the line overall
-			stroke(nx, last_change)
+				nx = points[end-1][0]
+				stroke(nx, last_change)
+				last_change = nx
 		
 		context.restore()
 
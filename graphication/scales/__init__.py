@@ -27,6 +27,27 @@ class BaseScale(object):
 		self.step = step
 	
 	
+	def __eq__(self, other):
+		
+		"""
+		Scales that put every value at the same point are equal, so results
+		worked out with a copy of a scale (say, in another process) can be
+		found again with the original.
+		"""
+		
+		return type(self) is type(other) and (self.min, self.range) == (other.min, other.range)
+	
+	
+	def __ne__(self, other):
+		
+		return not self == other
+	
+	
+	def __hash__(self):
+		
+		return hash((type(self), self.min, self.range))
+	
+	
 	def get_lines(self):
 		
 		"""Yields (linepos, title, ismajor) tuples."""
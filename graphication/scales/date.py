@@ -5,9 +5,9 @@ import datetime
 
 
 def d_to_timestamp(d):
-	if isinstance(d, (int, float)):
+	if isinstance(d, (int, long, float)):
 		return d
-	return time.mktime(d.timetuple())
+	return time.mktime(d.timetuple()) + getattr(d, "microsecond", 0) / 1000000.0
 
 def timestamp_to_d(t):
 	if isinstance(t, (datetime.datetime, datetime.date)):
@@ -66,9 +66,11 @@ class DateScale(BaseScale):
 	
 	
 	def get_point(self, value):
-		value = d_to_timestamp(value)
+		# Series keys are already timestamps; only convert actual dates
 		try:
 			return (value - self.min) / self.range
+		except TypeError:
+			return self.get_point(d_to_timestamp(value))
 		except ZeroDivisionError:
 			return 0
 	
@@ -133,8 +135,14 @@ class AutoDateScale(DateScale):
 		self.minor_step = minor_step
 
 
+def day_beginning(date):
+	if isinstance(date, datetime.datetime):
+		return date.replace(hour=0, minute=0, second=0, microsecond=0)
+	return date
+
+
 def week_beginning(date):
-	return date - datetime.timedelta(0 - date.weekday())
+	return date - datetime.timedelta(date.weekday())
 
 
 def week_range(start, end):
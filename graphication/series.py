@@ -1,5 +1,451 @@
 
+import math
+import operator
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import heapify, heappop, heapreplace
+import datetime
+
+# NumPy is optional; without it, SeriesSet falls back to plain lists.
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
 from graphication.css import hex_to_rgba
+from graphication.scales.date import d_to_timestamp, day_beginning, week_beginning, month_beginning
+
+
+def make_column(items):
+	"""
+	Packs a list of keys or values into a compact column.
+	Integers go into a long array, other numbers into a double array, and
+	anything else (datetimes, for example) is left as a plain list.
+	Things that are already arrays are returned as they are.
+	
+	@param items: The items to pack
+	@type items: list
+	"""
+	
+	if isinstance(items, array):
+		return items
+	for typecode in ("l", "d"):
+		try:
+			return array(typecode, items)
+		except (TypeError, OverflowError):
+			pass
+	return list(items)
+
+
+
+def memoized(method):
+	"""
+	Decorator for methods whose results only depend on the object's data
+	and their arguments. Results are kept in the object's memo (see
+	Series.memo), so repeated calls are free until the data changes.
+	Arguments must be hashable.
+	"""
+	
+	name = method.__name__
+	def wrapper(self, *args, **kwargs):
+		memo = self.memo()
+		key = (name, args, tuple(sorted(kwargs.items())))
+		try:
+			return memo[key]
+		except KeyError:
+			result = memo[key] = method(self, *args, **kwargs)
+			return result
+	wrapper.__name__ = name
+	wrapper.__doc__ = method.__doc__
+	return wrapper
+
+
+
+def is_numeric(column):
+	"""Returns True if the column holds numbers (rather than dates, say)."""
+	
+	if isinstance(column, array):
+		return True
+	return len(column) > 0 and isinstance(column[0], (int, long, float))
+
+
+
+def percentile(values, q):
+	"""
+	Returns the q'th percentile of 'values', interpolating linearly
+	between the two nearest values if it falls between them.
+	
+	@param values: The values, which must already be sorted
+	@type values: list
+	@param q: The percentile, between 0 and 100
+	@type q: float
+	"""
+	
+	position = (len(values) - 1) * q / 100.0
+	lower = int(math.floor(position))
+	upper = min(lower + 1, len(values) - 1)
+	return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+
+# Ways of boiling a bucket's values down to one, for resample
+AGGREGATES = {
+	"sum": sum,
+	"mean": lambda values: sum(values) / float(len(values)),
+	"min": min,
+	"max": max,
+	"first": lambda values: values[0],
+	"last": lambda values: values[-1],
+}
+
+
+
+def bucket_bounds(timestamp, bucket):
+	"""
+	Returns the (start, end) timestamps of the bucket 'timestamp' is in.
+	'bucket' is either a number of seconds, or one of the calendar
+	buckets 'day', 'week' (starting on Mondays) or 'month', in local time.
+	"""
+	
+	if isinstance(bucket, (int, long, float)):
+		start = timestamp - (timestamp % bucket)
+		return start, start + bucket
+	
+	date = day_beginning(datetime.datetime.fromtimestamp(timestamp))
+	if bucket == "day":
+		start = date
+		end = start + datetime.timedelta(1)
+	elif bucket == "week":
+		start = week_beginning(date)
+		end = start + datetime.timedelta(7)
+	elif bucket == "month":
+		start = month_beginning(date)
+		end = month_beginning(start + datetime.timedelta(32))
+	else:
+		raise ValueError("Unknown bucket size '%s'." % bucket)
+	return d_to_timestamp(start), d_to_timestamp(end)
+
+
+
+def key_to_number(key):
+	"""
+	Returns 'key' the way Series store it; dates and datetimes become
+	epoch timestamps, and anything else is left as it is.
+	"""
+	
+	if isinstance(key, datetime.date):
+		return d_to_timestamp(key)
+	return key
+
+
+
+def is_increasing(keys):
+	"""Returns True if every key is strictly greater than the one before it."""
+	
+	for i in xrange(1, len(keys)):
+		if not keys[i-1] < keys[i]:
+			return False
+	return True
+
+
+
+def column_append(column, item):
+	"""
+	Appends an item to a column made by make_column, returning the column.
+	If the item doesn't fit the column's type, a new, wider column is returned.
+	"""
+	
+	try:
+		column.append(item)
+	except (TypeError, OverflowError):
+		column = make_column(list(column) + [item])
+	return column
+
+
+
+def interpolate_at(keys, values, i, key):
+	"""
+	Works out the value at 'key', which would be inserted at index 'i' of
+	the sorted 'keys' column. Interpolates linearly between the neighbours,
+	and extrapolates constantly off either end.
+	"""
+	
+	# Extrapolate below or above?
+	if i == 0:
+		return values[0]
+	if i >= len(keys):
+		return values[-1]
+	
+	pre = keys[i-1]
+	post = keys[i]
+	
+	# Interpolate
+	pc = (key - pre) / float(post - pre)
+	
+	bottom = values[i-1]
+	top = values[i]
+	vrange = top - bottom
+	return bottom + (vrange * pc)
+
+
+
+# Marker for keys that aren't in a Series yet
+_missing = object()
+
+
+
+def merge_keys(columns):
+	"""
+	Merges several sorted key columns into one sorted list of distinct keys.
+	Returns a (keys, members) tuple, where members holds, for each key, the
+	indexes of the columns it appears in.
+	
+	@param columns: The sorted key columns to merge
+	@type columns: list
+	"""
+	
+	# The heap holds (key, column index, position in column)
+	heap = [(column[0], i, 0) for i, column in enumerate(columns) if len(column)]
+	heapify(heap)
+	
+	keys = []
+	members = []
+	while heap:
+		key, i, j = heap[0]
+		if keys and keys[-1] == key:
+			members[-1].append(i)
+		else:
+			keys.append(key)
+			members.append([i])
+		
+		# Move this column along, or drop it if it's run out
+		j += 1
+		if j < len(columns[i]):
+			heapreplace(heap, (columns[i][j], i, j))
+		else:
+			heappop(heap)
+	
+	return keys, members
+
+
+
+def lttb_indexes(xs, ys, threshold):
+	"""
+	Picks 'threshold' of the points (xs, ys) that best keep the shape of
+	the line they make, using Largest-Triangle-Three-Buckets.
+	Returns their indexes, in order; the first and last are always kept.
+	
+	@param xs: The x positions, in increasing order
+	@param ys: The y positions
+	@param threshold: How many points to keep
+	@type threshold: int
+	"""
+	
+	n = len(xs)
+	if threshold >= n:
+		return range(n)
+	if threshold < 3:
+		return [0, n-1]
+	
+	every = (n - 2) / float(threshold - 2)
+	indexes = [0]
+	a = 0
+	for i in range(threshold - 2):
+		# Average the next bucket, to use as the third triangle point
+		avg_start = int((i + 1) * every) + 1
+		avg_end = min(int((i + 2) * every) + 1, n)
+		avg_x = sum(xs[avg_start:avg_end]) / float(avg_end - avg_start)
+		avg_y = sum(ys[avg_start:avg_end]) / float(avg_end - avg_start)
+		
+		# Pick the point in this bucket making the largest triangle
+		ax, ay = xs[a], ys[a]
+		best = -1
+		for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+			area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+			if area > best:
+				best = area
+				a = j
+		indexes.append(a)
+	
+	indexes.append(n - 1)
+	return indexes
+
+
+
+def minmax_indexes(xs, ys, buckets):
+	"""
+	Splits the points (xs, ys) into 'buckets' equal-width buckets along x,
+	and keeps just the lowest and highest point in each, so that peaks and
+	troughs survive exactly. Returns their indexes, in order; the first and
+	last are always kept.
+	
+	@param xs: The x positions, in increasing order
+	@param ys: The y positions
+	@param buckets: How many buckets (usually pixels) to use
+	@type buckets: int
+	"""
+	
+	n = len(xs)
+	if n <= 2 * buckets:
+		return range(n)
+	
+	x_min = xs[0]
+	x_range = float(xs[-1] - x_min) or 1.0
+	lows = {}
+	highs = {}
+	for i in range(n):
+		bucket = min(int((xs[i] - x_min) / x_range * buckets), buckets - 1)
+		if bucket not in lows:
+			lows[bucket] = highs[bucket] = i
+		elif ys[i] < ys[lows[bucket]]:
+			lows[bucket] = i
+		elif ys[i] > ys[highs[bucket]]:
+			highs[bucket] = i
+	
+	indexes = set(lows.values())
+	indexes.update(highs.values())
+	indexes.update([0, n - 1])
+	indexes = list(indexes)
+	indexes.sort()
+	return indexes
+
+
+
+def prepare_series(job):
+	"""
+	Does the preparation SeriesSet.prepare asks for on one series; job is
+	a (series, grid, downsample) tuple. Returns what was worked out, so it
+	can be handed back from another process (this is a module-level
+	function so that process pools can pickle it).
+	"""
+	
+	series, grid, downsample = job
+	series.columns()
+	series.range_stats()
+	if grid is not None:
+		series.values_at(grid)
+	if downsample is not None:
+		series.downsample(*downsample)
+	return series._prepared_state()
+
+
+
+class ColumnView(object):
+	
+	"""
+	A read-only window onto the items from 'start' up to (but not
+	including) 'stop' of another column, which doesn't copy anything.
+	"""
+	
+	def __init__(self, column, start, stop):
+		# Views of views just look further into the original
+		if isinstance(column, ColumnView):
+			start += column.start
+			stop += column.start
+			column = column.column
+		self.column = column
+		self.start = start
+		self.stop = max(stop, start)
+	
+	
+	def __len__(self):
+		return self.stop - self.start
+	
+	
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			start, stop, step = index.indices(len(self))
+			if step != 1:
+				return [self[i] for i in xrange(start, stop, step)]
+			return ColumnView(self, start, stop)
+		
+		if index < 0:
+			index += len(self)
+		if not 0 <= index < len(self):
+			raise IndexError("ColumnView index out of range")
+		return self.column[self.start + index]
+	
+	
+	def __iter__(self):
+		column = self.column
+		for i in xrange(self.start, self.stop):
+			yield column[i]
+	
+	
+	def __array__(self, dtype=None):
+		# Only ever convert the window, not the whole column
+		import numpy
+		column = self.column
+		if isinstance(column, array):
+			# Slicing copies just the window (the column itself may be grown
+			# and moved later), which NumPy then uses without copying again
+			result = numpy.frombuffer(column[self.start:self.stop], column.typecode)
+		elif hasattr(column, "__array__"):
+			# NumPy arrays and MappedColumns can be viewed, then sliced
+			result = numpy.asarray(column)[self.start:self.stop]
+		else:
+			result = numpy.asarray(column[self.start:self.stop])
+		if dtype is not None:
+			result = result.astype(dtype, copy=False)
+		return result
+	
+	
+	def __repr__(self):
+		return "<ColumnView; items %i to %i>" % (self.start, self.stop)
+
+
+
+class SeriesData(dict):
+	
+	"""
+	A dictionary that counts how many times it has been modified,
+	so Series can tell when their cached columns have gone stale.
+	"""
+	
+	def __init__(self, *args, **kwargs):
+		dict.__init__(self, *args, **kwargs)
+		self.version = 0
+	
+	
+	def __setitem__(self, key, value):
+		dict.__setitem__(self, key, value)
+		self.version += 1
+	
+	
+	def __delitem__(self, key):
+		dict.__delitem__(self, key)
+		self.version += 1
+	
+	
+	def clear(self):
+		dict.clear(self)
+		self.version += 1
+	
+	
+	def pop(self, *args):
+		self.version += 1
+		return dict.pop(self, *args)
+	
+	
+	def popitem(self):
+		self.version += 1
+		return dict.popitem(self)
+	
+	
+	def setdefault(self, key, default=None):
+		self.version += 1
+		return dict.setdefault(self, key, default)
+	
+	
+	def update(self, *args, **kwargs):
+		dict.update(self, *args, **kwargs)
+		self.version += 1
+	
+	
+	def __reduce__(self):
+		# Rebuild with the items first, so unpickling doesn't go through
+		# __setitem__ before the version exists (and pool workers can use it)
+		return self.__class__, (dict(self),), self.__dict__
 
 
 class OrderedDict(object):
@@ -48,11 +494,179 @@ class Series(object):
 	
 	def __init__(self, title, data, color="#000000ff", styles={}, fill_color=None, line_width=None):
 		self.title = title
+		self.key_type = None
 		self.data = data
 		self.color = color.replace("#", "")
 		self.styles = styles
 		self.fill_color = fill_color
 		self.line_width = line_width
+		self._style_index = None
+		self._memo = (None, None, {})
+		self._grid_values = None
+	
+	
+	@classmethod
+	def from_arrays(cls, title, keys, values, *args, **kwargs):
+		"""
+		Alternate constructor; creates a Series from a sequence of keys and
+		a matching sequence of values, rather than a dictionary.
+		If the keys are already strictly increasing, they're used as the
+		sorted columns directly; otherwise, they're sorted first.
+		
+		Any further arguments are passed on to the normal constructor.
+		"""
+		
+		assert len(keys) == len(values), "You must have as many keys as values."
+		
+		self = cls(title, {}, *args, **kwargs)
+		if is_increasing(keys):
+			self.set_columns(make_column(keys), make_column(values))
+		else:
+			self.data = dict(zip(keys, values))
+		return self
+	
+	
+	def _get_data(self):
+		# Series made from columns only build a dictionary when it's needed
+		if self._data is None:
+			version, keys, values = self._columns
+			self._data = SeriesData(zip(keys, values))
+			self._data.version = version
+		return self._data
+	
+	
+	def _set_data(self, data):
+		if not isinstance(data, SeriesData):
+			if len(data) and isinstance(iter(data).next(), datetime.date):
+				data = [(self._key(key), value) for key, value in data.items()]
+			data = SeriesData(data)
+		# Replacing the data counts as a modification, too
+		if hasattr(self, "_columns"):
+			data.version += self.version + 1
+		self._data = data
+		self._columns = None
+		self._owns_columns = True
+		self._stats = None
+		self._sum = None
+	
+	data = property(_get_data, _set_data)
+	
+	
+	def set_columns(self, keys, values, value_range=None, total=None):
+		"""
+		Replaces the data with the given key and value columns, which are
+		used as they are; nothing is copied, and no dictionary is built
+		unless something later asks for one.
+		
+		@param keys: The keys, in strictly increasing order. Dates are
+		             converted to timestamps, so these do get copied.
+		@type keys: array, list, or other sequence
+		@param values: The values, in the same order as the keys
+		@type values: array, list, or other sequence
+		@param value_range: The (min, max) of the values, if already known
+		@type value_range: tuple
+		@param total: The sum of the values, if already known
+		"""
+		
+		assert len(keys) == len(values), "You must have as many keys as values."
+		if len(keys) and isinstance(keys[0], datetime.date):
+			keys = make_column(map(self._key, keys))
+		if hasattr(self, "_columns"):
+			version = self.version + 1
+		else:
+			version = 0
+		self._data = None
+		self._columns = (version, keys, values)
+		self._owns_columns = False
+		self._stats = None
+		self._sum = None
+		
+		# Save a scan over the values if we've been told about them
+		if value_range is not None and len(keys):
+			self._stats = (version, keys[0], keys[-1]) + tuple(value_range)
+		if total is not None:
+			self._sum = (version, total)
+	
+	
+	def _key(self, key):
+		# Dates are kept as timestamps; remember what they were, for labels
+		if isinstance(key, datetime.date):
+			self.key_type = type(key)
+			return d_to_timestamp(key)
+		return key
+	
+	
+	def original_key(self, key):
+		"""
+		Turns one of this series' keys back into the type it was given as;
+		dates and datetimes are stored as timestamps, so every calculation
+		can use plain numbers, but labels may want the dates back.
+		"""
+		
+		if self.key_type is None:
+			return key
+		return self.key_type.fromtimestamp(key)
+	
+	
+	def _get_version(self):
+		if self._data is None:
+			return self._columns[0]
+		return self._data.version
+	
+	version = property(_get_version)
+	
+	
+	def memo(self):
+		"""
+		Returns the dictionary that memoized methods keep their results in.
+		It's emptied whenever the data or the styles change.
+		"""
+		
+		version, styles, memo = self._memo
+		if version != self.version or styles != self.styles_state():
+			memo = {}
+			self._memo = (self.version, self.styles_state(), memo)
+		return memo
+	
+	
+	def _get_styles(self):
+		return self._styles
+	
+	
+	def _set_styles(self, styles):
+		# Styles count their changes, like the data does
+		if not isinstance(styles, SeriesData):
+			styles = SeriesData(styles)
+		self._styles = styles
+	
+	styles = property(_get_styles, _set_styles)
+	
+	
+	def styles_state(self):
+		"""
+		Returns a (styles, version) tuple that changes whenever the styles
+		do. Comparing two of these is quick, as tuples compare their items
+		by identity first.
+		"""
+		
+		return (self._styles, self._styles.version)
+	
+	
+	def columns(self):
+		"""
+		Returns a (keys, values) tuple of columns, sorted by key.
+		The columns are built once and reused until the data changes.
+		"""
+		
+		if self._data is None:
+			return self._columns[1:]
+		if self._columns is None or self._columns[0] != self._data.version:
+			keys = self._data.keys()
+			keys.sort()
+			values = [self._data[key] for key in keys]
+			self._columns = (self._data.version, make_column(keys), make_column(values))
+			self._owns_columns = True
+		return self._columns[1:]
 	
 	
 	def color_as_rgba(self):
@@ -67,47 +681,160 @@ class Series(object):
 	
 	
 	def keys(self):
-		return map(lambda (x,y): x, self.items())
+		return list(self.columns()[0])
 	
 	
 	def values(self):
-		return map(lambda (x,y): y, self.items())
+		return list(self.columns()[1])
 	
 	
 	def sum(self):
-		return sum(self.values())
+		if self._sum is None or self._sum[0] != self.version:
+			if self._data is None:
+				total = sum(self._columns[2])
+			else:
+				total = sum(self._data.values())
+			self._sum = (self.version, total)
+		return self._sum[1]
 	
 	
 	def items(self):
-		items = self.data.items()
-		items.sort()
-		return items
+		keys, values = self.columns()
+		return zip(keys, values)
+	
+	
+	def range_stats(self):
+		"""
+		Returns a (key_min, key_max, value_min, value_max) tuple.
+		These are cached, and kept up to date as points are set through
+		the Series; only deletions or replacing the data cause a rescan.
+		"""
+		
+		version = self.version
+		if self._stats is None or self._stats[0] != version:
+			if not len(self):
+				stats = (None, None, None, None)
+			elif self._columns is not None and self._columns[0] == version:
+				keys, values = self._columns[1:]
+				stats = (keys[0], keys[-1], min(values), max(values))
+			else:
+				values = self._data.values()
+				stats = (min(self._data), max(self._data), min(values), max(values))
+			self._stats = (version,) + stats
+		return self._stats[1:]
 	
 	
 	def key_range(self):
-		keys = self.data.keys()
-		if len(keys) == 0:
-			return None, None
-		return min(keys), max(keys)
+		return self.range_stats()[:2]
 	
 	
 	def value_range(self):
-		values = self.data.values()
-		if len(values) == 0:
-			return None, None
-		return min(values), max(values)
+		return self.range_stats()[2:]
 	
 	
 	def __iter__(self):
-		return iter(self.data)
+		if self._data is None:
+			return iter(self._columns[1])
+		return iter(self._data)
 	
 	
 	def __getitem__(self, key):
-		return self.data[key]
+		if isinstance(key, slice):
+			return self.between(key.start, key.stop)
+		key = key_to_number(key)
+		if self._data is None:
+			keys, values = self._columns[1:]
+			i = bisect_left(keys, key)
+			if i < len(keys) and keys[i] == key:
+				return values[i]
+			raise KeyError(key)
+		return self._data[key]
+	
+	
+	def __setitem__(self, key, value):
+		"""Sets the value at 'key', updating the cached ranges as it goes."""
+		
+		key = self._key(key)
+		stats = self._stats
+		fresh = stats is not None and stats[0] == self.version
+		data = self.data
+		old = data.get(key, _missing)
+		data[key] = value
+		
+		if not fresh:
+			return
+		
+		key_min, key_max, value_min, value_max = stats[1:]
+		if key_min is None:
+			self._stats = (data.version, key, key, value, value)
+		elif old is not _missing and ((old == value_min and value > old) or (old == value_max and value < old)):
+			# We might have just overwritten the only extreme value
+			self._stats = None
+		else:
+			self._stats = (
+				data.version,
+				min(key_min, key),
+				max(key_max, key),
+				min(value_min, value),
+				max(value_max, value),
+			)
+	
+	
+	def __delitem__(self, key):
+		del self.data[key_to_number(key)]
+	
+	
+	def append(self, key, value):
+		"""
+		Adds a point to the series. If 'key' is beyond every existing key,
+		the sorted columns, ranges and sum are all updated in place,
+		rather than being rebuilt on next use.
+		
+		@param key: The key of the new point
+		@param value: The value of the new point
+		"""
+		
+		key = self._key(key)
+		version = self.version
+		columns = self._columns
+		columns_fresh = columns is not None and columns[0] == version
+		sum_fresh = self._sum is not None and self._sum[0] == version
+		
+		# Is this a new key, off the top end of the series?
+		at_end = columns_fresh and (not len(columns[1]) or key > columns[1][-1])
+		
+		self[key] = value
+		
+		if at_end:
+			keys, values = columns[1:]
+			# Don't grow columns that might be shared with someone else
+			if not self._owns_columns:
+				keys, values = make_column(list(keys)), make_column(list(values))
+				self._owns_columns = True
+			keys = column_append(keys, key)
+			values = column_append(values, value)
+			self._columns = (self.version, keys, values)
+			if sum_fresh:
+				self._sum = (self.version, self._sum[1] + value)
+	
+	
+	def extend(self, pairs):
+		"""
+		Adds several (key, value) points to the series, in order.
+		Points whose keys increase monotonically take the fast path of append.
+		
+		@param pairs: The points to add
+		@type pairs: iterable of 2-tuples
+		"""
+		
+		for key, value in pairs:
+			self.append(key, value)
 	
 	
 	def __len__(self):
-		return len(self.data)
+		if self._data is None:
+			return len(self._columns[1])
+		return len(self._data)
 	
 	
 	def __str__(self):
@@ -115,13 +842,186 @@ class Series(object):
 		return "%d values, keys between %s and %s" % (len(self), kr[0], kr[1]) 
 	
 	
+	def derive(self, keys, values):
+		"""
+		Returns a new Series with the same title, colours and styles as this
+		one, but with the given (already sorted) keys and values.
+		"""
+		
+		# If we're handing over our own columns, we mustn't grow them in place
+		if self._columns is not None and (keys is self._columns[1] or values is self._columns[2]):
+			self._owns_columns = False
+		
+		series = Series(self.title, {}, self.color, self.styles, self.fill_color, self.line_width)
+		series.set_columns(make_column(keys), make_column(values))
+		series.key_type = self.key_type
+		return series
+	
+	
+	def combine(self, other, function):
+		"""
+		Returns a new Series made by calling function(mine, theirs) on each
+		pair of values from this series and 'other'. If 'other' is a Series,
+		the result has every key from either series, and any values missing
+		from one are interpolated (see interpolate()); otherwise 'other' is
+		used as the second value every time.
+		
+		@param other: The Series or number to combine with.
+		@param function: The function to combine values with, e.g. operator.add
+		@type function: callable
+		"""
+		
+		if isinstance(other, Series):
+			keys = merge_keys([self.columns()[0], other.columns()[0]])[0]
+			if numpy is not None and is_numeric(keys):
+				mine = numpy.interp(keys, *map(numpy.asarray, self.columns()))
+				theirs = numpy.interp(keys, *map(numpy.asarray, other.columns()))
+				values = function(mine, theirs).tolist()
+			else:
+				values = map(function, self.interpolate_many(keys), other.interpolate_many(keys))
+		else:
+			keys, values = self.columns()
+			if numpy is not None:
+				values = function(numpy.asarray(values), other).tolist()
+			else:
+				values = [function(value, other) for value in values]
+		return self.derive(keys, values)
+	
+	
+	def __add__(self, other):
+		return self.combine(other, operator.add)
+	
+	
 	def __sub__(self, other):
-		assert isinstance(other, Series)
-		newdata = dict([
-			(k, max(v - other[k], 0))
-			for k, v in self.data.items()
+		return self.combine(other, operator.sub)
+	
+	
+	def __mul__(self, other):
+		return self.combine(other, operator.mul)
+	
+	
+	def __div__(self, other):
+		return self.combine(other, operator.truediv)
+	
+	__truediv__ = __div__
+	
+	
+	def __radd__(self, other):
+		return self.combine(other, lambda a, b: b + a)
+	
+	
+	def __rsub__(self, other):
+		return self.combine(other, lambda a, b: b - a)
+	
+	
+	def __rmul__(self, other):
+		return self.combine(other, lambda a, b: b * a)
+	
+	
+	def __rdiv__(self, other):
+		return self.combine(other, lambda a, b: operator.truediv(b, a))
+	
+	__rtruediv__ = __rdiv__
+	
+	
+	def scale(self, factor, offset=0):
+		"""Returns a new Series with every value multiplied by 'factor', then 'offset' added."""
+		return self.combine(factor, lambda value, factor: value * factor + offset)
+	
+	
+	def clip(self, lower=None, upper=None):
+		"""
+		Returns a new Series with values below 'lower' raised to it,
+		and values above 'upper' lowered to it. Either can be None.
+		"""
+		
+		keys, values = self.columns()
+		if numpy is not None:
+			values = numpy.clip(numpy.asarray(values), lower, upper).tolist()
+		else:
+			if lower is not None:
+				values = [max(value, lower) for value in values]
+			if upper is not None:
+				values = [min(value, upper) for value in values]
+		return self.derive(keys, values)
+	
+	
+	def rolling_sum(self, window):
+		"""
+		Returns a new Series where each value is the sum of the last
+		'window' points up to and including that one (or as many as there
+		are, at the start).
+		
+		@param window: How many points to sum over
+		@type window: int
+		"""
+		
+		assert window > 0, "The window must hold at least one point."
+		keys, values = self.columns()
+		if numpy is not None:
+			totals = numpy.cumsum(numpy.asarray(values, float))
+			totals[window:] = totals[window:] - totals[:-window]
+			return self.derive(keys, totals.tolist())
+		
+		sums = []
+		total = 0
+		for i in xrange(len(values)):
+			total += values[i]
+			if i >= window:
+				total -= values[i - window]
+			sums.append(total)
+		return self.derive(keys, sums)
+	
+	
+	def rolling_mean(self, window):
+		"""
+		Returns a new Series where each value is the mean of the last
+		'window' points up to and including that one (or as many as there
+		are, at the start).
+		
+		@param window: How many points to average over
+		@type window: int
+		"""
+		
+		keys, sums = self.rolling_sum(window).columns()
+		return self.derive(keys, [
+			sums[i] / float(min(i + 1, window))
+			for i in xrange(len(sums))
 		])
-		return Series(self.title, newdata, self.color, self.styles, self.fill_color)
+	
+	
+	def resample(self, bucket, how="sum"):
+		"""
+		Returns a new Series with one point per time bucket, keyed by the
+		start of the bucket, and valued by combining the values in it.
+		Keys must be timestamps or dates; date keys give date results.
+		
+		Since the keys are sorted, each bucket's end is found by bisection,
+		so the calendar is only consulted once per bucket, not per point.
+		
+		@param bucket: A number of seconds, or 'day', 'week' or 'month'
+		@type bucket: int or str
+		@param how: How to combine values; 'sum', 'mean', 'min', 'max', 'first' or 'last'
+		@type how: str
+		"""
+		
+		try:
+			aggregate = AGGREGATES[how]
+		except KeyError:
+			raise ValueError("Unknown aggregation '%s'." % how)
+		
+		keys, values = self.columns()
+		new_keys = []
+		new_values = []
+		i = 0
+		while i < len(keys):
+			start, end = bucket_bounds(keys[i], bucket)
+			j = bisect_left(keys, end, i)
+			new_keys.append(start)
+			new_values.append(aggregate(values[i:j]))
+			i = j
+		
+		return self.derive(new_keys, new_values)
 	
 	
 	def interpolate(self, key):
@@ -130,77 +1030,456 @@ class Series(object):
 		constant extrapolation.
 		"""
 		
-		keys = self.keys()
+		keys, values = self.columns()
 		
-		if not keys:
+		if not len(keys):
 			raise ValueError("No values to interpolate between.")
 		
-		if key in keys:
-			return self.data[key]
+		# Find the first key that isn't below this one
+		key = key_to_number(key)
+		i = bisect_left(keys, key)
+		if i < len(keys) and keys[i] == key:
+			return values[i]
+		return interpolate_at(keys, values, i, key)
+	
+	
+	def values_at(self, keys):
+		"""
+		Returns the (interpolated) values of this series at each of 'keys',
+		which must be a sorted tuple. Only the latest result is kept, until
+		the data changes; asking again with the same tuple (like
+		SeriesSet.key_grid gives out) is free, so it can be worked out ahead
+		of time by SeriesSet.prepare.
+		
+		@rtype: sequence
+		"""
 		
-		pre = keys[0]
-		post = None
+		if self._grid_values is not None:
+			version, grid, values = self._grid_values
+			if version == self.version and (grid is keys or (isinstance(grid, tuple) and grid == keys)):
+				return values
 		
-		# Check to see if it needs to be extrapolated below.
-		if key < pre:
-			return self.data[pre]
+		if numpy is not None and is_numeric(keys):
+			own_keys, own_values = self.columns()
+			if not len(own_keys):
+				raise ValueError("No values to interpolate between.")
+			values = numpy.interp(keys, own_keys, own_values)
+		else:
+			values = self.interpolate_many(keys)
+		self._grid_values = (self.version, keys, values)
+		return values
+	
+	
+	def _prepared_state(self):
+		"""Returns the cached columns, stats and values, and the memo, for _adopt_prepared."""
 		
-		# Get the two values above and below it
-		for a_key in keys:
-			if a_key > key:
-				post = a_key
-				break
+		return self.version, self._columns, self._stats, self._grid_values, self.memo()
+	
+	
+	def _has_columns(self):
+		"""Returns if the columns are built and up to date."""
+		
+		return self._data is None or (self._columns is not None and self._columns[0] == self._data.version)
+	
+	
+	def _is_prepared(self, grid, downsample):
+		"""
+		Returns if prepare_series would find everything it works out for
+		this series (see SeriesSet.prepare) already cached.
+		"""
+		
+		version = self.version
+		if not self._has_columns():
+			return False
+		if self._stats is None or self._stats[0] != version:
+			return False
+		if grid is not None:
+			if self._grid_values is None or self._grid_values[0] != version or self._grid_values[1] is not grid:
+				return False
+		if downsample is not None and ("downsample", tuple(downsample), ()) not in self.memo():
+			return False
+		return True
+	
+	
+	def _adopt_prepared(self, state, grid=None):
+		"""
+		Takes on the caches from _prepared_state (which may have come from
+		a copy of this series in another process), unless the data has
+		changed since. If 'grid' is given, cached values for an equal grid
+		are kept against it, so later values_at calls with it match at once.
+		"""
+		
+		version, columns, stats, grid_values, memo = state
+		if version != self.version:
+			return
+		if columns is not None and columns is not self._columns:
+			self._columns = columns
+			self._owns_columns = True
+		if stats is not None:
+			self._stats = stats
+		if grid_values is not None:
+			if grid is not None and grid_values[1] == grid:
+				grid_values = (version, grid, grid_values[2])
+			self._grid_values = grid_values
+		own_memo = self.memo()
+		if memo is not own_memo:
+			own_memo.update(memo)
+	
+	
+	def interpolate_many(self, keys):
+		"""
+		Like interpolate, but for a whole sequence of keys at once.
+		Sorted keys are found in a single walk along this series; unsorted
+		ones still work, but fall back to a search each time they go backwards.
+		
+		@param keys: The keys to find values for
+		@type keys: sequence
+		@rtype: list
+		"""
+		
+		own_keys, own_values = self.columns()
+		if len(keys) and isinstance(keys[0], datetime.date):
+			keys = map(key_to_number, keys)
+		
+		if not len(own_keys):
+			raise ValueError("No values to interpolate between.")
+		
+		results = []
+		i = 0
+		last = None
+		num = len(own_keys)
+		for key in keys:
+			# Only search from scratch if we've gone backwards
+			if last is not None and key < last:
+				i = bisect_left(own_keys, key)
+			else:
+				while i < num and own_keys[i] < key:
+					i += 1
+			last = key
+			if i < num and own_keys[i] == key:
+				results.append(own_values[i])
 			else:
-				pre = a_key
+				results.append(interpolate_at(own_keys, own_values, i, key))
+		return results
+	
+	
+	@memoized
+	def downsample(self, threshold, method="minmax", position=None):
+		"""
+		Returns a Series with only as many points as are needed to draw
+		this one 'threshold' pixels wide. With the 'minmax' method, that's
+		the lowest and highest point per pixel, so peaks and troughs are
+		drawn exactly; with 'lttb', it's 'threshold' points picked by
+		Largest-Triangle-Three-Buckets.
+		
+		Each run of points between style changes is downsampled on its own,
+		so styles still change at exactly the same keys.
 		
-		# Extrapolate above?
-		if post is None:
-			return self.data[pre]
+		@param threshold: The width to downsample for, usually in pixels
+		@type threshold: int
+		@param method: Either 'minmax' or 'lttb'
+		@type method: str
+		@param position: A scale (or a function) turning a key into an x
+		                 position. Defaults to using the keys as they are.
+		                 Pass the scale itself, rather than its get_point,
+		                 if this is going to another process; bound methods
+		                 don't pickle.
+		@type position: graphication.scales.BaseScale
+		"""
 		
-		# Interpolate
-		range = post - pre
-		pc = (key - pre)
+		if method not in ["minmax", "lttb"]:
+			raise ValueError("Unknown downsampling method '%s'." % method)
 		
-		import datetime
-		if isinstance(range, datetime.timedelta):
-			pc = pc.days
-			range = range.days
-		pc = pc / float(range)
+		keys, values = self.columns()
+		n = len(keys)
+		if n <= threshold:
+			return self
 		
-		bottom = self.data[pre]
-		top = self.data[post]
-		vrange = top - bottom
-		return bottom + (vrange * pc)
+		if position is None:
+			xs = keys
+		else:
+			xs = map(getattr(position, "get_point", position), keys)
+		
+		# Work out where the style runs start and end
+		boundaries = set([bisect_left(keys, key) for key in self.style_index()[0]])
+		boundaries = [i for i in boundaries if 0 < i < n]
+		boundaries.sort()
+		boundaries = [0] + boundaries + [n]
+		
+		# Downsample each run, giving it its share of the width
+		span = float(xs[-1] - xs[0]) or 1.0
+		kept = []
+		for start, end in zip(boundaries, boundaries[1:]):
+			share = max(1, int(round(threshold * (xs[end-1] - xs[start]) / span)))
+			if method == "lttb":
+				indexes = lttb_indexes(xs[start:end], values[start:end], share)
+			else:
+				indexes = minmax_indexes(xs[start:end], values[start:end], share)
+			kept.extend([start + i for i in indexes])
+		
+		return self.derive([keys[i] for i in kept], [values[i] for i in kept])
+	
+	
+	def view(self, start, stop):
+		"""
+		Returns a Series holding the points with indexes from 'start' up to
+		(but not including) 'stop', in key order. It looks straight into
+		this series' columns, rather than copying them.
+		
+		@param start: The index of the first point to include
+		@type start: int
+		@param stop: The index to stop before
+		@type stop: int
+		"""
+		
+		keys, values = self.columns()
+		view = Series(self.title, {}, self.color, self.styles, self.fill_color, self.line_width)
+		view.set_columns(ColumnView(keys, start, stop), ColumnView(values, start, stop))
+		view.key_type = self.key_type
+		return view
 	
 	
-	def __getslice__(self, start, end):
-		newdata = {}
-		for key, value in self.data:
-			if key >= start and key <= end:
-				newdata[key] = value
-		return Series(self.title, newdata, self.color, self.styles)
+	def between(self, start=None, end=None):
+		"""
+		Returns a view (see view()) of the points with keys between
+		'start' and 'end', inclusive. Either can be None to leave that
+		end open.
+		"""
+		
+		keys = self.columns()[0]
+		if start is None:
+			lo = 0
+		else:
+			lo = bisect_left(keys, key_to_number(start))
+		if end is None:
+			hi = len(keys)
+		else:
+			hi = bisect_right(keys, key_to_number(end))
+		return self.view(lo, hi)
 	
 	
 	def split_at(self, positions):
-		"""Splits this series into several series at the given
-		positions."""
+		"""
+		Splits this series into several views (see view()) at the given
+		key positions. Each piece holds the points from its position up to,
+		but not including, the next one's.
 		
-		start = 0
-		seriess = []
-		for position in positions:
-			seriess.append(self[start:position])
-			start = position
-		seriess.append(self[start:])
+		@param positions: The keys to split at, in increasing order
+		@type positions: list
+		"""
+		
+		keys = self.columns()[0]
+		bounds = [bisect_left(keys, key_to_number(position)) for position in positions]
+		bounds = [0] + bounds + [len(keys)]
+		return [self.view(start, stop) for start, stop in zip(bounds, bounds[1:])]
+	
+	
+	def style_index(self):
+		"""
+		Returns a (keys, styles) tuple of the style changes, sorted by key.
+		It's cached until the styles change (see styles_state).
+		"""
+		
+		state = self.styles_state()
+		if self._style_index is None or self._style_index[0] != state:
+			points = [(key_to_number(key), style) for key, style in self.styles.items()]
+			points.sort()
+			keys = [key for key, style in points]
+			styles = [style for key, style in points]
+			self._style_index = (state, keys, styles)
+		return self._style_index[1:]
 	
 	
 	def style_at(self, key):
 		"""Returns the style at the given key."""
-		matches = [x for x in self.styles.keys() if x <= key]
-		matches.sort()
-		if matches:
-			return self.styles[matches[-1]]
+		keys, styles = self.style_index()
+		i = bisect_right(keys, key_to_number(key))
+		if i:
+			return styles[i-1]
 		else:
 			return 0
+	
+	
+	def style_runs(self):
+		"""
+		Yields (start, end, style) tuples, which split the points (in key
+		order) into runs of the same style; the points with indexes from
+		start up to, but not including, end all have that style.
+		"""
+		
+		keys = self.columns()[0]
+		style_keys, styles = self.style_index()
+		n = len(keys)
+		
+		run_start = run_style = None
+		start = 0
+		while start < n:
+			# Find the style here, and the first point after it changes
+			i = bisect_right(style_keys, keys[start])
+			if i:
+				style = styles[i-1]
+			else:
+				style = 0
+			if i < len(style_keys):
+				end = bisect_left(keys, style_keys[i], start)
+			else:
+				end = n
+			
+			# Merge runs with the same style
+			if style != run_style:
+				if run_start is not None:
+					yield run_start, start, run_style
+				run_start, run_style = start, style
+			start = end
+		
+		if run_start is not None:
+			yield run_start, n, run_style
+
+
+
+class RingSeries(Series):
+	
+	"""
+	A Series that only keeps its most recent points; the last 'capacity'
+	of them, those within 'window' of the newest key, or both.
+	Points must arrive in increasing key order, and old ones drop off the
+	front in constant time as new ones are appended. For date keys, the
+	window can be a timedelta (or a number of seconds).
+	"""
+	
+	def __init__(self, title, data={}, color="#000000ff", styles={}, fill_color=None, line_width=None, capacity=None, window=None):
+		assert capacity or window, "You must give a RingSeries a capacity or a window."
+		# Date keys are kept as timestamps, so windows have to be in seconds
+		if isinstance(window, datetime.timedelta):
+			window = window.total_seconds()
+		self.capacity = capacity
+		self.window = window
+		Series.__init__(self, title, data, color, styles, fill_color, line_width)
+	
+	
+	def _set_data(self, data):
+		Series._set_data(self, {})
+		self._keys = make_column([])
+		self._values = make_column([])
+		self._start = 0
+		items = data.items()
+		items.sort()
+		self.extend(items)
+	
+	data = property(Series._get_data, _set_data)
+	
+	
+	def set_columns(self, keys, values, value_range=None, total=None):
+		"""
+		Replaces the points with the given key and value columns. A ring
+		keeps columns of its own, so the points are appended to it one at a
+		time, and only as many kept as the capacity and window allow; the
+		value_range and total are ignored, as they may not hold any more.
+		"""
+		
+		assert len(keys) == len(values), "You must have as many keys as values."
+		self._set_data({})
+		self.extend(zip(keys, values))
+	
+	
+	def _has_columns(self):
+		# The ring's columns are always kept up to date
+		return True
+	
+	
+	def columns(self):
+		# Drop any evicted points off the front before handing them out.
+		# This makes new columns, rather than deleting from the old ones,
+		# as views (see view()) may still be looking at them.
+		if self._start:
+			self._keys = self._keys[self._start:]
+			self._values = self._values[self._start:]
+			self._start = 0
+		return self._keys, self._values
+	
+	
+	def range_stats(self):
+		if self._stats is None or self._stats[0] != self._data.version:
+			keys, values = self.columns()
+			if len(keys):
+				stats = (keys[0], keys[-1], min(values), max(values))
+			else:
+				stats = (None, None, None, None)
+			self._stats = (self._data.version,) + stats
+		return self._stats[1:]
+	
+	
+	def __setitem__(self, key, value):
+		key = self._key(key)
+		if key not in self._data:
+			self.append(key, value)
+			return
+		# Change a copy of the values, in case a view is looking at them
+		i = bisect_left(self._keys, key, self._start)
+		values = self._values[:]
+		try:
+			values[i] = value
+		except (TypeError, OverflowError):
+			values = list(values)
+			values[i] = value
+			values = make_column(values)
+		self._values = values
+		self._data[key] = value
+	
+	
+	def __delitem__(self, key):
+		raise TypeError("Points can only leave a RingSeries by being evicted.")
+	
+	
+	def derive(self, keys, values):
+		# The ring's columns live outside _columns, so check them here
+		if keys is self._keys or values is self._values:
+			self._owns_columns = False
+		return Series.derive(self, keys, values)
+	
+	
+	def append(self, key, value):
+		"""
+		Adds a point to the end of the series, evicting any points that
+		no longer fit in the capacity or window.
+		
+		@param key: The key of the new point; must be above all the others.
+		@param value: The value of the new point
+		"""
+		
+		key = self._key(key)
+		if len(self._keys) > self._start and key <= self._keys[-1]:
+			raise ValueError("RingSeries keys must be appended in increasing order.")
+		
+		# Our columns have been handed to a derived series; grow copies
+		if not self._owns_columns:
+			self._keys = self._keys[self._start:]
+			self._values = self._values[self._start:]
+			self._start = 0
+			self._owns_columns = True
+		
+		self._keys = column_append(self._keys, key)
+		self._values = column_append(self._values, value)
+		self._data[key] = value
+		
+		# Evict anything that's too old
+		if self.capacity:
+			while len(self._keys) - self._start > self.capacity:
+				self.evict()
+		if self.window is not None:
+			while self._keys[self._start] < key - self.window:
+				self.evict()
+	
+	
+	def evict(self):
+		"""Drops the oldest point from the series."""
+		
+		del self._data[self._keys[self._start]]
+		self._start += 1
+		
+		# Once most of the buffer is dead space, reclaim it
+		if self._start * 2 > len(self._keys):
+			self.columns()
 
 
 
@@ -217,6 +1496,40 @@ class SeriesSet(object):
 			self.series = []
 		else:
 			self.series = series
+		self._key_index = None
+		self._changes = 0
+		self._memo = (None, {})
+	
+	
+	def _get_version(self):
+		return self._changes + sum([series.version for series in self.series])
+	
+	# Increases whenever a series is added, or any series' data changes
+	version = property(_get_version)
+	
+	
+	def signature(self):
+		"""
+		Returns a list of the (id, version) of each series, which changes
+		whenever the series' data does, and also if the series list itself
+		is changed directly rather than through add_series.
+		"""
+		
+		return [(id(series), series.version) for series in self.series]
+	
+	
+	def memo(self):
+		"""
+		Returns the dictionary that memoized methods keep their results in.
+		It's emptied whenever the signature changes.
+		"""
+		
+		signature, memo = self._memo
+		current = self.signature()
+		if signature != current:
+			memo = {}
+			self._memo = (current, memo)
+		return memo
 	
 	
 	def __iter__(self):
@@ -227,28 +1540,63 @@ class SeriesSet(object):
 		return len(self.series)
 	
 	
+	def original_key(self, key):
+		"""
+		Turns a key from keys() back into the type the series were given
+		their keys as (see Series.original_key).
+		"""
+		
+		for series in self.series:
+			if series.key_type is not None:
+				return series.original_key(key)
+		return key
+	
+	
 	def add_series(self, series):
 		self.series.append(series)
+		self._key_index = None
+		self._changes += 1
 	
 	
+	@memoized
 	def key_range(self):
 		assert len(self.series) > 0, "Cannot find the range of an empty set."
 		mins, maxs = zip(*[series.key_range() for series in self.series])
-		mins = [m for m in mins if m]
-		maxs = [m for m in maxs if m]
+		mins = [m for m in mins if m is not None]
+		maxs = [m for m in maxs if m is not None]
 		return min(mins), max(maxs)
 	
 	
+	@memoized
 	def value_range(self):
 		assert len(self.series) > 0, "Cannot find the range of an empty set."
 		mins, maxs = zip(*[series.value_range() for series in self.series])
+		mins = [m for m in mins if m is not None]
+		maxs = [m for m in maxs if m is not None]
 		return min(mins), max(maxs)
 	
 	
+	@memoized
 	def sum(self):
 		return sum([s.sum() for s in self.series])
 	
 	
+	def key_index(self):
+		"""
+		Returns a (keys, members) tuple; keys is every possible key, in order,
+		and members the list of indexes of the series each key appears in.
+		
+		The index is built by merging the series' sorted keys, and cached
+		until a series is added or any series' data changes.
+		"""
+		
+		signature = self.signature()
+		if self._key_index is None or self._key_index[0] != signature:
+			keys, members = merge_keys([series.columns()[0] for series in self.series])
+			self._key_index = (signature, keys, members)
+		return self._key_index[1:]
+	
+	
 	def keys(self, with_series=False):
 		"""
 		Returns all possible keys, in order.
@@ -256,19 +1604,15 @@ class SeriesSet(object):
 		of series they appear in.
 		"""
 		
-		# TODO: This could be made a bit more efficient.
-		
-		keys = {}
-		for series in self.series:
-			for key in series.keys():
-				keys[key] = keys.get(key, []) + [series]
+		keys, members = self.key_index()
 		
 		if with_series:
-			keys = keys.items()
+			return [
+				(key, [self.series[i] for i in indexes])
+				for key, indexes in zip(keys, members)
+			]
 		else:
-			keys = keys.keys()
-		keys.sort()
-		return keys
+			return list(keys)
 	
 	
 	def stack(self, key):
@@ -277,17 +1621,348 @@ class SeriesSet(object):
 		return map(lambda x:(x,x.interpolate(key)), self.series)
 	
 	
+	@memoized
+	def key_grid(self):
+		"""
+		Returns keys() as a tuple, which series can cache their values at
+		(see Series.values_at); it's the same object until the data changes.
+		"""
+		
+		return tuple(self.keys())
+	
+	
+	def prepare(self, executor=None, interpolate=True, downsample=None):
+		"""
+		Does the per-series preparation for drawing up front - sorting each
+		series into columns, finding its ranges, interpolating it onto the
+		shared keys and, optionally, downsampling it - and caches the
+		results on the series. With an executor (anything with a map
+		method, like a multiprocessing.Pool), the series are prepared in
+		parallel. Series that already have everything asked for cached
+		(from an earlier prepare, say) aren't sent out again.
+		
+		@param executor: The pool to map the work over; None does it here
+		@param interpolate: If the series should be interpolated onto keys()
+		@type interpolate: bool
+		@param downsample: Arguments to call Series.downsample with, if any
+		@type downsample: tuple
+		"""
+		
+		grid = None
+		if interpolate:
+			grid = self.key_grid()
+		pending = [series for series in self.series if not series._is_prepared(grid, downsample)]
+		if not pending:
+			return
+		jobs = [(series, grid, downsample) for series in pending]
+		if executor is None:
+			states = map(prepare_series, jobs)
+		else:
+			states = executor.map(prepare_series, jobs)
+		for series, state in zip(pending, states):
+			series._adopt_prepared(state, grid)
+	
+	
+	@memoized
+	def as_matrix(self):
+		"""
+		Returns a (keys, matrix) tuple, where matrix is a dense NumPy array
+		with a row for each key in keys() and a column for each series.
+		Series without a value at a key have one interpolated for them.
+		Needs NumPy.
+		"""
+		
+		assert numpy is not None, "You need NumPy installed to use as_matrix."
+		
+		keys = self.keys()
+		grid = self.key_grid()
+		matrix = numpy.empty((len(keys), len(self.series)))
+		for i, series in enumerate(self.series):
+			matrix[:, i] = series.values_at(grid)
+		return keys, matrix
+	
+	
+	@memoized
+	def rows(self):
+		"""
+		Returns a (keys, rows) tuple, where rows is a list with, for each
+		key, a list of the (interpolated) value of every series.
+		"""
+		
+		if numpy is not None:
+			keys, matrix = self.as_matrix()
+			return keys, matrix.tolist()
+		
+		keys = self.keys()
+		grid = self.key_grid()
+		columns = [series.values_at(grid) for series in self.series]
+		return keys, map(list, zip(*columns))
+	
+	
+	@memoized
 	def stacks(self):
 		"""Returns a list of (key, stack) for each possible key."""
 		
-		return map(lambda x:(x, self.stack(x)), self.keys())
+		keys, rows = self.rows()
+		return [
+			(key, zip(self.series, row))
+			for key, row in zip(keys, rows)
+		]
 	
 	
+	@memoized
 	def totals(self):
-		"""Generates a list of (key, total-at-key) tuples, in key order."""
+		"""Returns a list of (key, total-at-key) tuples, in key order."""
+		
+		if numpy is not None:
+			keys, matrix = self.as_matrix()
+			return zip(keys, matrix.sum(axis=1).tolist())
+		
+		keys, rows = self.rows()
+		return [(key, sum(row)) for key, row in zip(keys, rows)]
+	
+	
+	@memoized
+	def sparse_columns(self, pad=True):
+		"""
+		Returns a (keys, columns) tuple, where columns has a (start, stop,
+		values) tuple for each series: values are the series' (interpolated)
+		values at keys[start:stop], the keys inside its own span. Outside
+		that span the series counts as zero, rather than being extrapolated.
+		If pad is true, the span is widened by a zero-valued key at either
+		end (where there is one), so the series visibly drops to nothing.
+		"""
+		
+		keys = self.keys()
+		numeric = numpy is not None and is_numeric(keys)
+		columns = []
+		for series in self.series:
+			own_keys, own_values = series.columns()
+			if not len(own_keys):
+				columns.append((0, 0, []))
+				continue
+			start = bisect_left(keys, own_keys[0])
+			stop = bisect_right(keys, own_keys[-1])
+			if numeric:
+				values = numpy.interp(keys[start:stop], own_keys, own_values).tolist()
+			else:
+				values = series.interpolate_many(keys[start:stop])
+			if pad:
+				if start > 0:
+					start -= 1
+					values = [0] + values
+				if stop < len(keys):
+					stop += 1
+					values.append(0)
+			columns.append((start, stop, values))
+		return keys, columns
+	
+	
+	@memoized
+	def stack_offsets(self, sparse=False):
+		"""
+		Returns a list of (key, offsets) tuples, in key order, where offsets
+		are the running totals up the stack at that key; they start with 0,
+		and end with the total, so there is one more than there are series.
+		
+		If sparse is true, each series only counts over its own span of
+		keys (see sparse_columns), and only those cells are interpolated.
+		"""
+		
+		if numpy is not None:
+			if sparse:
+				keys, columns = self.sparse_columns()
+				matrix = numpy.zeros((len(keys), len(self.series)))
+				for i, (start, stop, values) in enumerate(columns):
+					matrix[start:stop, i] = values
+			else:
+				keys, matrix = self.as_matrix()
+			offsets = numpy.zeros((len(keys), len(self.series) + 1))
+			numpy.cumsum(matrix, axis=1, out=offsets[:, 1:])
+			return zip(keys, offsets.tolist())
+		
+		if sparse:
+			keys, columns = self.sparse_columns()
+			rows = [[0] * len(self.series) for key in keys]
+			for i, (start, stop, values) in enumerate(columns):
+				for row, value in zip(rows[start:stop], values):
+					row[i] = value
+		else:
+			keys, rows = self.rows()
+		stack_offsets = []
+		for key, row in zip(keys, rows):
+			total = 0
+			offsets = [total]
+			for value in row:
+				total += value
+				offsets.append(total)
+			stack_offsets.append((key, offsets))
+		return stack_offsets
+	
+	
+	def resample(self, bucket, how="sum"):
+		"""
+		Returns a new SeriesSet with every series resampled into the same
+		time buckets. See Series.resample.
+		"""
+		
+		return SeriesSet([series.resample(bucket, how) for series in self.series])
+	
+	
+	def derive(self, title, keys, values, color="#000000ff"):
+		"""
+		Returns a new Series of the given keys (from keys()) and values,
+		whose keys are the same type as this set's series' were given as,
+		like Series.derive keeps them.
+		"""
+		
+		series = Series.from_arrays(title, keys, values, color)
+		for member in self.series:
+			if member.key_type is not None:
+				series.key_type = member.key_type
+				break
+		return series
+	
+	
+	def sum_series(self, title="Total", color="#000000ff"):
+		"""Returns a Series of the total of every series, at every key."""
 		
-		for key in self.keys():
-			yield key, sum(map(lambda x:x.interpolate(key), self.series))
+		keys, totals = zip(*self.totals()) or ([], [])
+		return self.derive(title, keys, totals, color)
+	
+	
+	def mean_series(self, title="Mean", color="#000000ff"):
+		"""Returns a Series of the mean of every series, at every key."""
+		
+		if numpy is not None:
+			keys, matrix = self.as_matrix()
+			return self.derive(title, keys, matrix.mean(axis=1).tolist(), color)
+		
+		keys, rows = self.rows()
+		return self.derive(title, keys, [sum(row) / float(len(row)) for row in rows], color)
+	
+	
+	def percentile_series(self, percentiles, color="#000000ff"):
+		"""
+		Returns a list of Series, one for each of the given percentiles of
+		the series' values at every key; for example, [10, 50, 90] gives a
+		band around the median. Each Series is titled with its percentile.
+		
+		@param percentiles: The percentiles to find, between 0 and 100
+		@type percentiles: list
+		"""
+		
+		if numpy is not None:
+			keys, matrix = self.as_matrix()
+			columns = [numpy.percentile(matrix, q, axis=1).tolist() for q in percentiles]
+		else:
+			keys, rows = self.rows()
+			rows = map(sorted, rows)
+			columns = [[percentile(row, q) for row in rows] for q in percentiles]
+		
+		return [
+			self.derive("%s%%" % q, keys, column, color)
+			for q, column in zip(percentiles, columns)
+		]
+	
+	
+	@classmethod
+	def from_columns(cls, keys, columns, colors=None):
+		"""
+		Alternate constructor; creates a SeriesSet from one shared sequence
+		of keys, and a column of values for each series.
+		
+		@param keys: The keys shared by all the series
+		@type keys: sequence
+		@param columns: The series, as (title, values) tuples
+		@type columns: list
+		@param colors: Colours for the series, in the same order
+		@type colors: list
+		"""
+		
+		# Only check, convert and pack the keys once, as they're shared
+		key_type = None
+		if len(keys) and isinstance(keys[0], datetime.date):
+			key_type = type(keys[0])
+			keys = map(key_to_number, keys)
+		increasing = is_increasing(keys)
+		if increasing:
+			keys = make_column(keys)
+		
+		self = cls()
+		for i, (title, values) in enumerate(columns):
+			series = Series(title, {})
+			series.key_type = key_type
+			if colors:
+				series.color = colors[i].replace("#", "")
+			if increasing:
+				series.set_columns(keys, make_column(values))
+			else:
+				series.data = dict(zip(keys, values))
+			self.add_series(series)
+		return self
+	
+	
+	@classmethod
+	def from_csv(cls, filename, key_column=0, chunk_size=1048576, delimiter=","):
+		"""
+		Alternate constructor; reads a SeriesSet from a CSV file. The first
+		line holds the titles; one column holds the keys, and each other
+		column becomes a Series. Every key and value must be a number.
+		
+		The file is parsed a chunk at a time, straight into arrays, so
+		only one chunk of text is ever in memory at once.
+		
+		@param filename: The CSV file to read, or an open file
+		@type filename: str or file
+		@param key_column: The index of the column holding the keys
+		@type key_column: int
+		@param chunk_size: Roughly how many bytes to parse at a time
+		@type chunk_size: int
+		"""
+		
+		if isinstance(filename, basestring):
+			fo = open(filename)
+		else:
+			fo = filename
+		
+		titles = [x.strip() for x in fo.readline().split(delimiter)]
+		width = len(titles)
+		columns = [array("d") for title in titles]
+		
+		leftover = ""
+		while True:
+			chunk = fo.read(chunk_size)
+			if not chunk:
+				chunk, leftover = leftover, ""
+				if not chunk.strip():
+					break
+			else:
+				# Hold back the last partial line until the next chunk
+				chunk = leftover + chunk
+				cut = chunk.rfind("\n") + 1
+				chunk, leftover = chunk[:cut], chunk[cut:]
+			
+			# Split the whole chunk into fields at once, rather than by rows
+			lines = [line for line in chunk.splitlines() if line.strip()]
+			if not lines:
+				continue
+			for line in lines:
+				if line.count(delimiter) != width - 1:
+					raise ValueError("Every row in the CSV file must have %i fields." % width)
+			fields = delimiter.join(lines).split(delimiter)
+			for i in range(width):
+				columns[i].extend(map(float, fields[i::width]))
+		
+		if fo is not filename:
+			fo.close()
+		
+		keys = columns[key_column]
+		return cls.from_columns(keys, [
+			(titles[i], columns[i])
+			for i in range(width)
+			if i != key_column
+		])
 	
 	
 	def get_series(self, index):
@@ -303,6 +1978,9 @@ class Node(object):
 	Has a single value, as well as attributes like title and color.
 	"""
 	
+	# Plots lay nodes out using left, old_left, x and y.
+	__slots__ = ("value", "title", "color", "left", "old_left", "x", "y")
+	
 	def __init__(self, value, title="Node", color="#036"):
 		
 		self.value = value
@@ -317,6 +1995,8 @@ class NodeLink(object):
 	Represents a link between to Nodes.
 	"""
 	
+	__slots__ = ("start", "end", "weight", "color")
+	
 	def __init__(self, start, end, weight=1, color="#600"):
 		
 		self.start = start
@@ -329,25 +2009,43 @@ class NodeSet(object):
 	
 	"""
 	Contains many Nodes, as well as the relationships that link them together.
+	Each node gets an integer id, in the order they're added.
 	"""
 	
 	def __init__(self):
 		
 		self.nodes = []
 		self.links = []
+		self.ids = {}
+		self.adjacency = []
 	
 	
 	def add_node(self, node):
-		"""Adds the given Node to the NodeSet."""
+		"""Adds the given Node to the NodeSet, and returns its id."""
+		assert node not in self.ids, "That node is already in this NodeSet."
+		self.ids[node] = len(self.nodes)
 		self.nodes.append(node)
+		self.adjacency.append([])
+		return self.ids[node]
+	
+	
+	def id_of(self, node):
+		"""Returns the integer id of the given Node."""
+		return self.ids[node]
 	
 	
 	def add_link(self, link):
 		"""Links the first node to the second. Note that in some graphs, order might matter."""
 		assert isinstance(link, NodeLink), "You must pass in a NodeLink"
-		assert link.start in self.nodes, "The first node is not in this NodeSet."
-		assert link.end in self.nodes, "The second node is not in this NodeSet."
+		assert link.start in self.ids, "The first node is not in this NodeSet."
+		assert link.end in self.ids, "The second node is not in this NodeSet."
+		
+		# Index the link against both its nodes (just once if they're the same)
+		index = len(self.links)
 		self.links.append(link)
+		self.adjacency[self.ids[link.start]].append(index)
+		if link.end is not link.start:
+			self.adjacency[self.ids[link.end]].append(index)
 	
 	
 	def adjacent_to(self, node, both=True):
@@ -356,10 +2054,11 @@ class NodeSet(object):
 		@param node: The node to return nodes adjacent to.
 		@param both: If we should use links in either direction (True) or only ones away (False)."""
 		
-		for link in self.links:
-			if link.start == node:
+		for index in self.adjacency[self.ids[node]]:
+			link = self.links[index]
+			if link.start is node:
 				yield link.end, link
-			elif link.end == node and both:
+			elif both:
 				yield link.start, link
 	
 	
@@ -0,0 +1,209 @@
+"""
+graphication.seriesfile:
+
+  A compact binary file format for Series, which can be memory-mapped.
+
+A file holds a short header (the title, colours and styles, plus some
+statistics), followed by the keys and then the values, each as a packed
+run of little-endian doubles. Opening a file maps it into memory and reads
+the keys and values straight out of it, so nothing is loaded until it's
+used, and processes opening the same file share one copy in the page cache.
+"""
+
+import os
+import sys
+import mmap
+import struct
+import datetime
+from array import array
+
+try:
+	import json
+except ImportError:
+	import simplejson as json
+
+from graphication.series import Series
+from graphication.scales.date import d_to_timestamp
+
+
+MAGIC = "GRSERIES"
+
+# Magic, format version, number of points, header length
+PREAMBLE = struct.Struct("<8sIQI")
+
+FORMAT_VERSION = 1
+
+# How the original type of (timestamp) keys is recorded in the header
+KEY_TYPE_NAMES = {
+	datetime.date: "date",
+	datetime.datetime: "datetime",
+}
+KEY_TYPES = dict([(name, key_type) for key_type, name in KEY_TYPE_NAMES.items()])
+
+
+
+class MappedColumn(object):
+	
+	"""
+	A read-only sequence of little-endian doubles, read straight out of
+	a buffer (usually an mmap) without copying. Slicing it gives another
+	MappedColumn onto the same buffer.
+	"""
+	
+	def __init__(self, buffer, offset, length):
+		self.buffer = buffer
+		self.offset = offset
+		self.length = length
+	
+	
+	def __len__(self):
+		return self.length
+	
+	
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			start, stop, step = index.indices(self.length)
+			if step != 1:
+				return [self[i] for i in xrange(start, stop, step)]
+			return MappedColumn(self.buffer, self.offset + start * 8, max(stop - start, 0))
+		
+		if index < 0:
+			index += self.length
+		if not 0 <= index < self.length:
+			raise IndexError("MappedColumn index out of range")
+		return struct.unpack_from("<d", self.buffer, self.offset + index * 8)[0]
+	
+	
+	def __iter__(self):
+		for i in xrange(self.length):
+			yield struct.unpack_from("<d", self.buffer, self.offset + i * 8)[0]
+	
+	
+	def __array__(self, dtype=None):
+		# Lets NumPy use the mapped memory directly, too
+		import numpy
+		column = numpy.frombuffer(self.buffer, "<f8", self.length, self.offset)
+		if dtype is not None:
+			column = column.astype(dtype)
+		return column
+	
+	
+	def __repr__(self):
+		return "<MappedColumn; %i values>" % self.length
+
+
+
+def to_doubles(items):
+	"""Packs numbers (or dates, as timestamps) into little-endian doubles."""
+	
+	column = array("d", [d_to_timestamp(item) for item in items])
+	if sys.byteorder != "little":
+		column.byteswap()
+	return column.tostring()
+
+
+
+def write_series(series, filename):
+	"""
+	Writes the Series out to 'filename'. Date keys are stored as timestamps.
+	
+	@param series: The series to write
+	@type series: graphication.series.Series
+	@param filename: The file to write to
+	@type filename: str
+	"""
+	
+	keys, values = series.columns()
+	value_min, value_max = series.value_range()
+	
+	header = json.dumps({
+		"title": series.title,
+		"color": series.color,
+		"fill_color": series.fill_color,
+		"line_width": series.line_width,
+		"styles": [(d_to_timestamp(key), style) for key, style in series.styles.items()],
+		"key_type": KEY_TYPE_NAMES.get(series.key_type),
+		"value_min": value_min,
+		"value_max": value_max,
+		"sum": series.sum(),
+	})
+	
+	# Pad the header so the columns start on an 8-byte boundary
+	header += " " * (-(PREAMBLE.size + len(header)) % 8)
+	
+	fo = open(filename, "wb")
+	try:
+		fo.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(keys), len(header)))
+		fo.write(header)
+		fo.write(to_doubles(keys))
+		fo.write(to_doubles(values))
+	finally:
+		fo.close()
+
+
+
+def open_series(filename):
+	"""
+	Opens a file written by write_series, returning a Series that reads
+	its keys and values from the memory-mapped file.
+	
+	@param filename: The file to open
+	@type filename: str
+	@rtype: graphication.series.Series
+	"""
+	
+	fo = open(filename, "rb")
+	try:
+		# (Empty files can't be mapped at all)
+		if os.fstat(fo.fileno()).st_size < PREAMBLE.size:
+			raise ValueError("'%s' is too short to be a series file." % filename)
+		buffer = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+	finally:
+		fo.close()
+	
+	# Don't leave the file mapped if it turns out to be no good
+	try:
+		return read_series(buffer, filename)
+	except:
+		buffer.close()
+		raise
+
+
+
+def read_series(buffer, filename):
+	"""
+	Reads a Series out of the buffer holding a series file (see
+	open_series), checking first that the buffer is long enough.
+	"""
+	
+	magic, version, length, header_length = PREAMBLE.unpack_from(buffer, 0)
+	if magic != MAGIC:
+		raise ValueError("'%s' is not a series file." % filename)
+	if version != FORMAT_VERSION:
+		raise ValueError("'%s' is a version %i series file; only version %i is supported." % (filename, version, FORMAT_VERSION))
+	
+	size = PREAMBLE.size + header_length + length * 16
+	if len(buffer) < size:
+		raise ValueError("'%s' is truncated; it should be %i bytes long, but is %i." % (filename, size, len(buffer)))
+	
+	header = json.loads(buffer[PREAMBLE.size:PREAMBLE.size + header_length])
+	offset = PREAMBLE.size + header_length
+	keys = MappedColumn(buffer, offset, length)
+	values = MappedColumn(buffer, offset + length * 8, length)
+	
+	series = Series(
+		header["title"],
+		{},
+		header["color"],
+		dict([(key, style) for key, style in header["styles"]]),
+		header["fill_color"],
+		header["line_width"],
+	)
+	series.set_columns(
+		keys,
+		values,
+		(header["value_min"], header["value_max"]),
+		header["sum"],
+	)
+	series.key_type = KEY_TYPES.get(header.get("key_type"))
+	return series
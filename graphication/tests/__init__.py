@@ -6,6 +6,9 @@ import unittest
 
 # Import tests from submodules
 from graphication.tests.series import *
+from graphication.tests.seriesfile import *
+from graphication.tests.arrowfile import *
+from graphication.tests.css import *
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,74 @@
+import os
+import unittest
+import datetime
+import tempfile
+
+from graphication.arrowfile import from_table, from_long_table, read_parquet, overlapping_row_groups, pyarrow
+from graphication.scales.date import d_to_timestamp
+
+class ArrowFileTest(unittest.TestCase):
+
+    def createTable(self):
+        return pyarrow.Table.from_arrays([
+            pyarrow.array([1.0, 2.0, 3.0, 4.0]),
+            pyarrow.array([10.0, 20.0, 30.0, 40.0]),
+            pyarrow.array([5, 6, 7, 8]),
+        ], ["key", "a", "b"])
+
+    @unittest.skipIf(pyarrow is None, "PyArrow is not installed")
+    def test_wide(self):
+        "Wide tables should give a series per column, sharing the keys"
+        series_set = from_table(self.createTable(), columns=["a"], key_range=(2, 3))
+        self.assertEqual([series.title for series in series_set], ["a"])
+        a = series_set.get_series(0)
+        self.assertEqual(a.items(), [(2, 20), (3, 30)])
+        self.assertEqual(a.value_range(), (20, 30))
+        self.assertEqual(a.interpolate(2.5), 25)
+
+    @unittest.skipIf(pyarrow is None, "PyArrow is not installed")
+    def test_dates(self):
+        "Date keys should become the same timestamps Series give them"
+        days = [datetime.datetime(2009, 3, 28), datetime.datetime(2009, 3, 29, 12)]
+        table = pyarrow.Table.from_arrays([
+            pyarrow.array(days, pyarrow.timestamp("ms")),
+            pyarrow.array([d.date() for d in days], pyarrow.date32()),
+            pyarrow.array([1.0, 2.0]),
+        ], ["key", "day", "value"])
+        series = from_table(table, columns=["value"]).get_series(0)
+        self.assertEqual(series.keys(), map(d_to_timestamp, days))
+        self.assertEqual(series.original_key(series.keys()[1]), days[1])
+        series = from_table(table, key="day", columns=["value"]).get_series(0)
+        self.assertEqual(series.keys(), [d_to_timestamp(d.date()) for d in days])
+
+    @unittest.skipIf(pyarrow is None, "PyArrow is not installed")
+    def test_long(self):
+        "Long tables should be split into a series per title, in key order"
+        table = pyarrow.Table.from_arrays([
+            pyarrow.array([2, 1, 1, 3, 2]),
+            pyarrow.array(["x", "x", "y", "x", "y"]),
+            pyarrow.array([20.0, 10.0, 1.0, 30.0, 2.0]),
+        ], ["key", "series", "value"])
+        x, y = from_long_table(table)
+        self.assertEqual((x.title, y.title), ("x", "y"))
+        self.assertEqual(x.items(), [(1, 10), (2, 20), (3, 30)])
+        self.assertEqual(y.items(), [(1, 1), (2, 2)])
+        only = from_long_table(table, columns=["y"], key_range=(2, None))
+        self.assertEqual([series.items() for series in only], [[(2, 2)]])
+
+    @unittest.skipIf(pyarrow is None, "PyArrow is not installed")
+    def test_parquet(self):
+        "Parquet files should read back with projection and key ranges"
+        handle, filename = tempfile.mkstemp(".parquet")
+        os.close(handle)
+        try:
+            pyarrow.parquet.write_table(self.createTable(), filename)
+            series_set = read_parquet(filename, columns=["b"], key_range=(None, 2))
+            self.assertEqual(series_set.get_series(0).items(), [(1, 5), (2, 6)])
+            # With a row group per row, most of them shouldn't be read
+            pyarrow.parquet.write_table(self.createTable(), filename, row_group_size=1)
+            metadata = pyarrow.parquet.ParquetFile(filename).metadata
+            self.assertEqual(overlapping_row_groups(metadata, "key", (2, 3)), [1, 2])
+            series_set = read_parquet(filename, columns=["a"], key_range=(2, 3))
+            self.assertEqual(series_set.get_series(0).items(), [(2, 20), (3, 30)])
+        finally:
+            os.unlink(filename)
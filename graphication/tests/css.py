@@ -0,0 +1,206 @@
+import gc
+import os
+import sys
+import shutil
+import unittest
+import tempfile
+
+import cPickle
+
+from graphication.css import CssStylesheet, CssRule, selector_split, load_stylesheet, COMPILED_VERSION
+
+def can_name(filename):
+    "Returns if the filesystem encoding can represent the filename."
+    try:
+        filename.encode(sys.getfilesystemencoding() or "ascii")
+        return True
+    except UnicodeError:
+        return False
+
+
+class CssStylesheetTest(unittest.TestCase):
+
+    def setUp(self):
+        # Keep compiled stylesheets (from @imports, say) out of the real cache
+        self.cache_setting = os.environ.get("GRAPHICATION_CACHE")
+        self.cache = tempfile.mkdtemp()
+        os.environ["GRAPHICATION_CACHE"] = self.cache
+
+    def tearDown(self):
+        if self.cache_setting is None:
+            del os.environ["GRAPHICATION_CACHE"]
+        else:
+            os.environ["GRAPHICATION_CACHE"] = self.cache_setting
+        shutil.rmtree(self.cache)
+
+    def createStylesheet(self):
+        return CssStylesheet.from_css("""
+            linegraph { color: #000; padding: 2 4; }
+            linegraph grid { color: #aaa; }
+            grid.major { width: 2; }
+        """)
+
+    def test_properties(self):
+        "Properties should inherit, and be overridden by more specific rules"
+        stylesheet = self.createStylesheet()
+        props = stylesheet["linegraph grid.major.first"]
+        self.assertEqual(props["color"], "#aaa")
+        self.assertEqual(props["width"], "2")
+        self.assertEqual(props["padding-left"], "4")
+        self.assertEqual(props.sub("label")["width"], "2")
+
+    def test_computed_cache(self):
+        "Computed properties should be cached, frozen, and dropped when the rules change"
+        stylesheet = self.createStylesheet()
+        props = stylesheet["linegraph grid.major"]
+        self.assert_(stylesheet["linegraph  grid.major"] is props)
+        self.assertRaises(TypeError, props.__setitem__, "color", "#fff")
+        self.assertRaises(TypeError, props.update, {})
+        copy = props.copy()
+        copy["color"] = "#fff"
+        self.assertEqual(props["color"], "#aaa")
+        stylesheet.add_rule(CssRule("grid", {"color": "#f00"}))
+        self.assertEqual(stylesheet["linegraph grid.major"]["color"], "#aaa")
+        stylesheet.add_rule(CssRule("linegraph grid.major", {"color": "#0f0"}))
+        self.assertEqual(stylesheet["linegraph grid.major"]["color"], "#0f0")
+        stylesheet.imerge(CssStylesheet.from_css("linegraph grid.major { width: 3; }"))
+        self.assertEqual(stylesheet["linegraph grid.major"]["width"], "3")
+
+    def test_rule_index(self):
+        "Only rules whose last part matches some element should be candidates"
+        stylesheet = self.createStylesheet()
+        stylesheet.add_rule(CssRule("wavegraph label", {"color": "#f00"}))
+        stylesheet.add_rule(CssRule("#x", {"color": "#0f0"}))
+        element = selector_split("linegraph grid#x", False)
+        candidates = [str(rule.selector) for rule in stylesheet.candidate_rules(element)]
+        self.assertEqual(candidates, ["linegraph", "linegraph grid", "*#x"])
+        self.assertEqual(stylesheet["linegraph grid#x"]["color"], "#0f0")
+        self.assertEqual(stylesheet["linegraph grid#x.major label"]["width"], "2")
+
+    def test_parsing(self):
+        "Comments, imports and the last declaration without a semicolon should all parse"
+        directory = tempfile.mkdtemp()
+        sys.path.insert(0, directory)
+        try:
+            fo = open(os.path.join(directory, "testtheme.css"), "w")
+            fo.write("label { color: #123; }")
+            fo.close()
+            stylesheet = CssStylesheet.from_css("""
+                /* A comment { with: braces; } */
+                @import testtheme;
+                grid.major /* here */ line {
+                    width: 2; /* and here */
+                    color: #ddd
+                }
+                label { font-size: 12 }
+            """)
+        finally:
+            sys.path.remove(directory)
+            sys.modules.pop("testtheme_css", None)
+            shutil.rmtree(directory)
+        self.assertEqual(
+            [(str(rule.selector), rule.properties) for rule in stylesheet],
+            [
+                ("label", {"color": "#123"}),
+                ("label", {"font-size": "12"}),
+                ("grid.major line", {"width": "2", "color": "#ddd"}),
+            ],
+        )
+
+    def test_compiled(self):
+        "Compiled stylesheets should be used until their source changes"
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "compiled.css")
+            fo = open(filename, "w")
+            fo.write("label { padding: 1 2; }")
+            fo.close()
+            stylesheet = load_stylesheet(filename, directory)
+            self.assertEqual(stylesheet["label"]["padding-right"], "2")
+            [compiled] = [name for name in os.listdir(directory) if name.endswith(".cssc")]
+            compiled = os.path.join(directory, compiled)
+            # Doctor the compiled copy, to see that it gets used
+            stylesheet.add_rule(CssRule("label", {"color": "#f00"}))
+            fo = open(compiled, "wb")
+            cPickle.dump((COMPILED_VERSION, filename, stylesheet.sources), fo, cPickle.HIGHEST_PROTOCOL)
+            cPickle.dump(stylesheet, fo, cPickle.HIGHEST_PROTOCOL)
+            fo.close()
+            self.assertEqual(load_stylesheet(filename, directory)["label"]["color"], "#f00")
+            fo = open(filename, "w")
+            fo.write("label { padding: 3; }")
+            fo.close()
+            stylesheet = load_stylesheet(filename, directory)
+            self.assertEqual(stylesheet["label"]["padding-right"], "3")
+            self.assert_("color" not in stylesheet["label"])
+        finally:
+            shutil.rmtree(directory)
+
+    @unittest.skipIf(not can_name(u"caf\xe9"), "The filesystem encoding can't name the file")
+    def test_compiled_unicode(self):
+        "Stylesheets with non-ASCII paths should compile too"
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(unicode(directory), u"caf\xe9.css")
+            fo = open(filename, "w")
+            fo.write("label { width: 2; }")
+            fo.close()
+            self.assertEqual(load_stylesheet(filename, directory)["label"]["width"], "2")
+            self.assertEqual(load_stylesheet(filename, directory)["label"]["width"], "2")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_compiled_broken(self):
+        "Broken or doctored compiled stylesheets should just be parsed again"
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "broken.css")
+            fo = open(filename, "w")
+            fo.write("label { width: 2; }")
+            fo.close()
+            load_stylesheet(filename, directory)
+            [compiled] = [name for name in os.listdir(directory) if name.endswith(".cssc")]
+            compiled = os.path.join(directory, compiled)
+            fo = open(compiled, "wb")
+            cPickle.dump((COMPILED_VERSION, filename, [(filename, os.path.getmtime(filename), 19)]), fo)
+            cPickle.dump(os.remove, fo)
+            fo.close()
+            self.assertEqual(load_stylesheet(filename, directory)["label"]["width"], "2")
+            fo = open(compiled, "wb")
+            fo.write("garbage")
+            fo.close()
+            self.assertEqual(load_stylesheet(filename, directory)["label"]["width"], "2")
+            # Somewhere unwritable should still work, just without a compiled copy
+            unwritable = os.path.join(filename, "cache")
+            self.assertEqual(load_stylesheet(filename, unwritable)["label"]["width"], "2")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_add_rule_order(self):
+        "Rules should be kept in order of specificity, with later ones after equal ones"
+        stylesheet = CssStylesheet()
+        rules = [CssRule(selector) for selector in ["grid label", "label", "grid.major", "label"]]
+        for rule in rules:
+            stylesheet.add_rule(rule)
+        self.assertEqual(stylesheet.rules, [rules[1], rules[3], rules[2], rules[0]])
+
+    def test_merge(self):
+        "Merging should fold together identical selectors, and remember its results"
+        stylesheet = self.createStylesheet()
+        theme = CssStylesheet.from_css("linegraph { color: #fff; } label { width: 1; }")
+        merged = stylesheet.merge(theme)
+        self.assertEqual(len(merged.rules), 4)
+        self.assertEqual(merged["linegraph"]["color"], "#fff")
+        self.assertEqual(merged["linegraph"]["padding-top"], "2")
+        self.assert_(stylesheet.merge(theme) is merged)
+        self.assertRaises(TypeError, merged.add_rule, CssRule("label", {"width": "2"}))
+        self.assertEqual(merged.copy()["linegraph"]["color"], "#fff")
+        self.assert_(stylesheet.merge() is stylesheet.merge())
+        self.assertEqual(list(stylesheet.merge().rules), stylesheet.rules)
+        theme.add_rule(CssRule("label", {"width": "3"}))
+        remerged = stylesheet.merge(theme)
+        self.assert_(remerged is not merged)
+        self.assertEqual(remerged["label"]["width"], "3")
+        self.assertEqual(len(remerged.rules), 4)
+        del theme, merged, remerged
+        gc.collect()
+        self.assertEqual(len(stylesheet.merged), 0)
@@ -1,7 +1,14 @@
 
 import unittest
+import datetime
+import pickle
+import multiprocessing
+from array import array
+from StringIO import StringIO
+from multiprocessing.pool import ThreadPool
 
-from graphication.series import Series
+from graphication.series import Series, RingSeries, SeriesSet, ColumnView, Node, NodeLink, NodeSet, numpy
+from graphication.scales import SimpleScale
 
 class SeriesTest(unittest.TestCase):
 
@@ -61,6 +68,162 @@ class SeriesTest(unittest.TestCase):
         )
 
 
+    def test_range_updates(self):
+        "Ranges should follow points set and deleted through the series"
+        series = self.createSeries()
+        series.key_range()
+        series[100] = 20
+        self.assertEqual(series.key_range(), (-4, 100))
+        self.assertEqual(series.value_range(), (3, 20))
+        series[100] = 1
+        self.assertEqual(series.value_range(), (1, 12.125))
+        series[100] = 5
+        self.assertEqual(series.value_range(), (3, 12.125))
+        del series[-4]
+        self.assertEqual(series.key_range(), (1, 100))
+        self.assertEqual(series.value_range(), (4.25, 12.125))
+        series = self.createEmptySeries()
+        series.value_range()
+        series[0] = 2
+        self.assertEqual(series.value_range(), (2, 2))
+        self.assertEqual(series.keys(), [0])
+
+
+    def test_append(self):
+        "Appending should keep the columns, ranges and sum in step"
+        series = self.createSeries()
+        keys, values = series.columns()
+        total = series.sum()
+        series.append(90, 1.5)
+        series.extend([(91, 2), (95, 30)])
+        self.assert_(series.columns()[0] is keys)
+        self.assertEqual(series.keys(), [-4, 1, 2.5, 7, 88, 90, 91, 95])
+        self.assertEqual(series.value_range(), (1.5, 30))
+        self.assertEqual(series.sum(), total + 33.5)
+        series.append(0, 1)
+        self.assertEqual(series.keys(), [-4, 0, 1, 2.5, 7, 88, 90, 91, 95])
+        self.assertEqual(series.sum(), total + 34.5)
+
+
+    def test_downsample(self):
+        "Downsampling should keep extremes and style boundaries"
+        data = dict([(i, (i * 37) % 101) for i in range(1000)])
+        data[500] = 1000
+        data[501] = -1000
+        series = Series("Big", data, styles={0: Series.STYLE_NONE, 733: Series.STYLE_DASHED})
+        for method in ["minmax", "lttb"]:
+            small = series.downsample(50, method)
+            self.assert_(len(small) <= 102)
+            self.assertEqual(small.key_range(), (0, 999))
+            self.assert_(732 in small.keys() and 733 in small.keys())
+        self.assert_(1000 in small.values() or -1000 in small.values())
+        small = series.downsample(50, "minmax")
+        self.assertEqual(small.value_range(), (-1000, 1000))
+        self.assert_(series.downsample(1000) is series)
+        self.assertRaises(ValueError, series.downsample, 10, "bogus")
+
+
+    def test_from_arrays(self):
+        "Series built from arrays should behave like ones built from dicts"
+        series = Series.from_arrays("Arrays", [-4, 1, 2.5, 7, 88], [3, 4.5, 5, 12.125, 4.25])
+        self.assertEqual(series.items(), self.createSeries().items())
+        self.assertEqual(series[2.5], 5)
+        self.assertRaises(KeyError, series.__getitem__, 3)
+        self.assertEqual(len(series), 5)
+        self.assertEqual(series.value_range(), (3, 12.125))
+        self.assertEqual(series.interpolate(0), 4.2)
+        series.append(90, 1)
+        self.assertEqual(series.key_range(), (-4, 90))
+        self.assertEqual(series.data[90], 1)
+        series = Series.from_arrays("Unsorted", [3, 1, 2], [30, 10, 20])
+        self.assertEqual(series.items(), [(1, 10), (2, 20), (3, 30)])
+
+
+    def test_views(self):
+        "Slices and splits should be views onto the same columns"
+        series = self.createSeries()
+        view = series[1:7]
+        self.assertEqual(view.items(), [(1, 4.5), (2.5, 5), (7, 12.125)])
+        self.assert_(view.columns()[0].column is series.columns()[0])
+        self.assertEqual(series[2:].keys(), [2.5, 7, 88])
+        self.assertEqual(series[-10.5:0.5].keys(), [-4])
+        self.assertEqual(series[:7].keys(), [-4, 1, 2.5, 7])
+        self.assertEqual(series[-4:7].keys(), series.between(-4, 7).keys())
+        self.assertEqual(view.view(1, 3).items(), [(2.5, 5), (7, 12.125)])
+        self.assertEqual(view.value_range(), (4.5, 12.125))
+        self.assertEqual(view.interpolate(100), 12.125)
+        pieces = series.split_at([1, 7])
+        self.assertEqual([piece.keys() for piece in pieces], [[-4], [1, 2.5], [7, 88]])
+        pieces[0].append(0, 1)
+        self.assertEqual(series.keys(), [-4, 1, 2.5, 7, 88])
+
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_view_arrays(self):
+        "Views should turn into NumPy arrays of just their window"
+        for column in [array("d", range(10)), range(10), numpy.arange(10.0)]:
+            view = ColumnView(column, 2, 5)
+            self.assertEqual(numpy.asarray(view).tolist(), [2, 3, 4])
+            self.assertEqual(numpy.asarray(view, "f4").dtype, numpy.dtype("f4"))
+
+
+    def test_arithmetic(self):
+        "Arithmetic should line series up by key, interpolating gaps"
+        a = Series("A", {0: 1, 2: 3, 4: 5})
+        b = Series("B", {1: 10, 3: 30})
+        self.assertEqual((a + b).items(), [(0, 11), (1, 12), (2, 23), (3, 34), (4, 35)])
+        self.assertEqual((b - a).values(), [9, 8, 17, 26, 25])
+        self.assertEqual((a * 2).items(), [(0, 2), (2, 6), (4, 10)])
+        self.assertEqual((a / 2).values(), [0.5, 1.5, 2.5])
+        self.assertEqual((12 - a).values(), [11, 9, 7])
+        self.assertEqual((3 / Series("C", {0: 2})).values(), [1.5])
+        self.assertEqual(a.scale(2, 1).values(), [3, 7, 11])
+        self.assertEqual((b - a).clip(upper=20).values(), [9, 8, 17, 20, 20])
+        # Appending to a series mustn't change ones derived from it
+        series = Series("D", {1: 1, 2: -1, 3: 3})
+        series.append(4, 4)
+        clipped = series.clip(lower=0)
+        scaled = series * 2
+        series.append(10, 5)
+        self.assertEqual(clipped.items(), [(1, 1), (2, 0), (3, 3), (4, 4)])
+        self.assertEqual(scaled.keys(), [1, 2, 3, 4])
+        self.assertEqual(scaled.key_range(), (1, 4))
+        self.assertEqual(series.keys(), [1, 2, 3, 4, 10])
+
+    def test_rolling(self):
+        "Rolling sums and means should cover the trailing window"
+        series = Series("Roll", dict([(i, i) for i in range(6)]))
+        self.assertEqual(series.rolling_sum(3).values(), [0, 1, 3, 6, 9, 12])
+        self.assertEqual(series.rolling_mean(2).values(), [0, 0.5, 1.5, 2.5, 3.5, 4.5])
+
+
+    def test_resample(self):
+        "Resampling should gather points into time buckets"
+        series = Series("Seconds", {0: 1, 30: 2, 59: 3, 60: 4, 150: 5})
+        self.assertEqual(series.resample(60).items(), [(0, 6), (60, 4), (120, 5)])
+        self.assertEqual(series.resample(60, "mean").values(), [2, 4, 5])
+        self.assertEqual(series.resample(60, "last").values(), [3, 4, 5])
+        self.assertRaises(ValueError, series.resample, 60, "bogus")
+        self.assertRaises(ValueError, series.resample, "fortnight")
+        day = datetime.datetime(2008, 1, 28, 15, 30)
+        series = Series("Dated", dict([
+            (day + datetime.timedelta(i), i)
+            for i in range(10)
+        ]))
+        weeks = series.resample("week", "max")
+        self.assertEqual(map(weeks.original_key, weeks.keys()), [
+            datetime.datetime(2008, 1, 28),
+            datetime.datetime(2008, 2, 4),
+        ])
+        self.assertEqual(weeks.values(), [6, 9])
+        months = series.resample("month")
+        self.assertEqual(months.values(), [6, 39])
+        self.assertEqual(
+            months.original_key(months.keys()[1]),
+            datetime.datetime(2008, 2, 1),
+        )
+
+
     def test_interpolation(self):
         "Interpolation should work, linearly, and extrapolation constantly"
         series = self.createSeries()
@@ -84,4 +247,381 @@ class SeriesTest(unittest.TestCase):
         self.assertEqual(series.style_at(0), Series.STYLE_NONE)
         self.assertEqual(series.style_at(1), Series.STYLE_NONE)
         self.assertEqual(series.style_at(2), Series.STYLE_DASHED)
-        self.assertEqual(series.style_at(3), Series.STYLE_DASHED)
\ No newline at end of file
+        self.assertEqual(series.style_at(3), Series.STYLE_DASHED)
+        self.assertEqual(series.style_at(-1), 0)
+        series.styles[3] = Series.STYLE_LIGHT
+        self.assertEqual(series.style_at(3), Series.STYLE_LIGHT)
+        series.styles = {0: Series.STYLE_DASHED}
+        self.assertEqual(series.style_at(3), Series.STYLE_DASHED)
+        series.styles[0] = Series.STYLE_NONE
+        self.assertEqual(series.style_at(3), Series.STYLE_NONE)
+
+
+    def test_style_runs(self):
+        "Style runs should cover every point, merging repeated styles"
+        series = Series(
+            "Test",
+            dict([(i, i) for i in range(10)]),
+            styles={
+                -5: Series.STYLE_DASHED,
+                2.5: Series.STYLE_LIGHT,
+                4: Series.STYLE_LIGHT,
+                7: Series.STYLE_NONE,
+                100: Series.STYLE_DASHED,
+            },
+        )
+        self.assertEqual(
+            list(series.style_runs()),
+            [
+                (0, 3, Series.STYLE_DASHED),
+                (3, 7, Series.STYLE_LIGHT),
+                (7, 10, Series.STYLE_NONE),
+            ],
+        )
+        self.assertEqual(list(self.createEmptySeries().style_runs()), [])
+
+    def test_columns(self):
+        "Sorted columns should be cached, and rebuilt when the data changes"
+        series = self.createSeries()
+        keys, values = series.columns()
+        self.assertEqual(list(keys), [-4, 1, 2.5, 7, 88])
+        self.assert_(series.columns()[0] is keys)
+        series.data[3] = 6
+        self.assertEqual(series.keys(), [-4, 1, 2.5, 3, 7, 88])
+        self.assertEqual(series.values(), [3, 4.5, 5, 6, 12.125, 4.25])
+        series.data = {5: 1, 2: 0}
+        self.assertEqual(series.items(), [(2, 0), (5, 1)])
+        self.assertEqual(series.key_range(), (2, 5))
+
+
+    def test_interpolate_many(self):
+        "Batch interpolation should agree with one-at-a-time interpolation"
+        series = self.createSeries()
+        keys = [-7, -4, -3, 0, 1, 5, 88, 424324.5]
+        self.assertEqual(
+            series.interpolate_many(keys),
+            [series.interpolate(key) for key in keys],
+        )
+        self.assertEqual(
+            series.interpolate_many([5, -3, 0]),
+            [series.interpolate(key) for key in [5, -3, 0]],
+        )
+        self.assertRaises(ValueError, self.createEmptySeries().interpolate_many, [1])
+        start = datetime.date(2008, 1, 1)
+        series = Series("Dated", {
+            start: 1,
+            start + datetime.timedelta(10): 11,
+        })
+        self.assertEqual(
+            series.interpolate_many([start + datetime.timedelta(4)]),
+            [5],
+        )
+        self.assertEqual(series.key_type, datetime.date)
+        self.assertEqual(series.original_key(series.keys()[0]), start)
+        # Keys are timestamps, so there's no rounding to whole days
+        start = datetime.datetime(2008, 1, 1)
+        series = Series("Timed", {
+            start: 0,
+            start + datetime.timedelta(1): 24,
+        })
+        self.assertEqual(series.interpolate(start + datetime.timedelta(hours=6)), 6)
+        self.assertEqual(series[start + datetime.timedelta(1)], 24)
+
+
+
+class RingSeriesTest(unittest.TestCase):
+
+    def test_capacity(self):
+        "Only the last 'capacity' points should be kept"
+        series = RingSeries("Ring", {0: 1, 1: 2}, capacity=3)
+        series.extend([(2, 3), (3, 4), (4, 5)])
+        self.assertEqual(series.items(), [(2, 3), (3, 4), (4, 5)])
+        self.assertEqual(len(series), 3)
+        self.assertEqual(series.key_range(), (2, 4))
+        self.assertEqual(series.value_range(), (3, 5))
+        self.assertEqual(series.interpolate(2.5), 3.5)
+        self.assertEqual(series.interpolate(0), 3)
+        self.assertRaises(KeyError, series.__getitem__, 1)
+        self.assertRaises(ValueError, series.append, 3.5, 0)
+        series[3] = 10
+        self.assertEqual(series.values(), [3, 10, 5])
+
+    def test_views(self):
+        "Views of a ring should keep their points as it moves on"
+        series = RingSeries("Ring", capacity=2)
+        series.extend([(0, 0), (1, 1)])
+        view = series.view(0, 2)
+        series.extend([(2, 2), (3, 3), (4, 4), (5, 5)])
+        series[5] = 50
+        self.assertEqual(series.items(), [(4, 4), (5, 50)])
+        self.assertEqual(view.items(), [(0, 0), (1, 1)])
+
+    def test_from_arrays(self):
+        "Rings made from columns should still keep to their capacity"
+        series = RingSeries.from_arrays("Ring", [1, 2, 3], [10, 20, 30], capacity=2)
+        self.assertEqual(len(series), 2)
+        self.assertEqual(series.items(), [(2, 20), (3, 30)])
+        series.append(4, 40)
+        self.assertEqual(series.items(), [(3, 30), (4, 40)])
+
+    def test_derived(self):
+        "Appending to a ring shouldn't change series derived from it"
+        series = RingSeries("Ring", capacity=100)
+        series.extend([(i, i) for i in range(5)])
+        doubled = series * 2
+        series.append(5, 5)
+        self.assertEqual(len(doubled), 5)
+        self.assertEqual(doubled.keys(), [0, 1, 2, 3, 4])
+        self.assertEqual(len(series), 6)
+
+    def test_window(self):
+        "Only points within 'window' of the newest should be kept"
+        series = RingSeries("Ring", window=10)
+        for key in range(0, 100, 3):
+            series.append(key, key * 2)
+        self.assertEqual(series.keys(), [90, 93, 96, 99])
+        self.assertEqual(series.sum(), 756)
+
+    def test_date_window(self):
+        "A timedelta window should work with date keys"
+        start = datetime.datetime(2009, 3, 1)
+        series = RingSeries("Ring", window=datetime.timedelta(hours=1))
+        for i in range(10):
+            series.append(start + datetime.timedelta(minutes=20 * i), i)
+        self.assertEqual(series.window, 3600)
+        self.assertEqual(series.values(), [6, 7, 8, 9])
+        self.assertEqual(series.original_key(series.keys()[0]), start + datetime.timedelta(hours=2))
+
+
+class SeriesSetTest(unittest.TestCase):
+
+    def createSeriesSet(self):
+        return SeriesSet([
+            Series("A", {0: 1, 2: 3, 4: 5}),
+            Series("B", {1: 10, 3: 30}),
+        ])
+
+    def test_stacks(self):
+        "Stacks and totals should interpolate series at every key"
+        series_set = self.createSeriesSet()
+        a, b = series_set
+        self.assertEqual(
+            series_set.stacks()[1],
+            (1, [(a, 2), (b, 10)]),
+        )
+        self.assertEqual(
+            list(series_set.totals()),
+            [(0, 11), (1, 12), (2, 23), (3, 34), (4, 35)],
+        )
+        self.assertEqual(
+            series_set.stack_offsets()[2],
+            (2, [0, 3, 23]),
+        )
+
+    def test_sparse_stacks(self):
+        "Sparse stacking should only count series over their own spans"
+        series_set = SeriesSet([
+            Series("A", {0: 1, 1: 2, 2: 3, 3: 4, 4: 5}),
+            Series("B", {2: 10}),
+        ])
+        self.assertEqual(
+            series_set.sparse_columns(),
+            ([0, 1, 2, 3, 4], [(0, 5, [1, 2, 3, 4, 5]), (1, 4, [0, 10, 0])]),
+        )
+        self.assertEqual(
+            series_set.sparse_columns(pad=False)[1][1],
+            (2, 3, [10]),
+        )
+        self.assertEqual(
+            [offsets for key, offsets in series_set.stack_offsets(sparse=True)],
+            [[0, 1, 1], [0, 2, 2], [0, 3, 13], [0, 4, 4], [0, 5, 5]],
+        )
+        self.assertEqual(series_set.stack_offsets()[0], (0, [0, 1, 11]))
+
+    def test_keys(self):
+        "The merged key index should be kept up to date"
+        series_set = self.createSeriesSet()
+        a, b = series_set
+        self.assertEqual(series_set.keys(), [0, 1, 2, 3, 4])
+        self.assertEqual(series_set.keys(True)[1], (1, [b]))
+        b.data[2] = 20
+        self.assertEqual(series_set.keys(True)[2], (2, [a, b]))
+        c = Series("C", {-1: 0, 9: 0})
+        series_set.add_series(c)
+        self.assertEqual(series_set.keys(), [-1, 0, 1, 2, 3, 4, 9])
+        self.assertEqual(series_set.keys(True)[-1], (9, [c]))
+
+    def test_version(self):
+        "The set's version should change whenever its data does"
+        series_set = self.createSeriesSet()
+        version = series_set.version
+        series_set.get_series(0).append(5, 1)
+        self.assert_(series_set.version > version)
+        version = series_set.version
+        series_set.add_series(Series("C", {}))
+        self.assert_(series_set.version > version)
+
+    def test_from_columns(self):
+        "Series built from shared keys shouldn't disturb each other"
+        series_set = SeriesSet.from_columns([1, 2, 3], [
+            ("A", [1, 2, 3]),
+            ("B", [4, 5, 6]),
+        ], ["#f00", "#0f0"])
+        a, b = series_set
+        self.assertEqual(b.items(), [(1, 4), (2, 5), (3, 6)])
+        self.assertEqual(a.color, "f00")
+        a.append(4, 4)
+        self.assertEqual(b.keys(), [1, 2, 3])
+        self.assertEqual(series_set.keys(), [1, 2, 3, 4])
+
+    def test_from_csv(self):
+        "CSV files should be read column by column, across chunks"
+        csv = "when, a, b\n" + "".join([
+            "%i, %i, %s\n" % (i, i * 2, i / 2.0)
+            for i in range(100)
+        ])
+        series_set = SeriesSet.from_csv(StringIO(csv), chunk_size=64)
+        a, b = series_set
+        self.assertEqual((a.title, b.title), ("a", "b"))
+        self.assertEqual(a.keys(), range(100))
+        self.assertEqual(a.values(), range(0, 200, 2))
+        self.assertEqual(b[51], 25.5)
+        self.assertRaises(ValueError, SeriesSet.from_csv, StringIO("a,b\n1,2\n3\n"))
+
+    def test_aggregates(self):
+        "Set-wide aggregates should be worked out at every key"
+        series_set = self.createSeriesSet()
+        self.assertEqual(series_set.sum_series().values(), [11, 12, 23, 34, 35])
+        self.assertEqual(series_set.mean_series().values(), [5.5, 6, 11.5, 17, 17.5])
+        low, high = series_set.percentile_series([0, 75])
+        self.assertEqual(low.title, "0%")
+        self.assertEqual(low.values(), [1, 2, 3, 4, 5])
+        self.assertEqual(high.values(), [7.75, 8, 15.75, 23.5, 23.75])
+
+    def test_memo(self):
+        "Derived data should be reused until the data changes"
+        series_set = self.createSeriesSet()
+        offsets = series_set.stack_offsets()
+        self.assert_(series_set.stack_offsets() is offsets)
+        series_set.get_series(1).append(5, 50)
+        self.assert_(series_set.stack_offsets() is not offsets)
+        self.assertEqual(series_set.stack_offsets()[-1], (5, [0, 5, 55]))
+        series = Series("Big", dict([(i, i % 7) for i in range(100)]))
+        small = series.downsample(10)
+        self.assert_(series.downsample(10) is small)
+        series.styles = {50: Series.STYLE_DASHED}
+        self.assert_(series.downsample(10) is not small)
+
+    def test_prepare(self):
+        "Prepared series should have their results cached, even from another process"
+
+        class PickleExecutor(object):
+            "Passes jobs and results through pickle, like a process pool"
+            def map(self, function, jobs):
+                return [
+                    pickle.loads(pickle.dumps(function(pickle.loads(pickle.dumps(job, 2))), 2))
+                    for job in jobs
+                ]
+
+        pools = [ThreadPool(2), multiprocessing.Pool(2)]
+        try:
+            for executor in [None, PickleExecutor()] + pools:
+                series_set = self.createSeriesSet()
+                scale = SimpleScale(0, 4)
+                series_set.prepare(executor, downsample=(2, "minmax", scale))
+                a, b = series_set
+                self.assert_(a._grid_values[1] is series_set.key_grid())
+                self.assertEqual(list(b.values_at(series_set.key_grid())), [10, 10, 20, 30, 30])
+                self.assert_(("downsample", (2, "minmax", SimpleScale(0, 4)), ()) in a.memo())
+                self.assertEqual(b.range_stats(), (1, 3, 10, 30))
+                self.assertEqual(series_set.totals()[1], (1, 12))
+        finally:
+            for pool in pools:
+                pool.terminate()
+                pool.join()
+
+    def test_date_aggregates(self):
+        "Aggregate series should keep the set's date keys"
+        start = datetime.date(2009, 3, 1)
+        series_set = SeriesSet([
+            Series("A", {start: 1, start + datetime.timedelta(1): 2}),
+            Series("B", {start: 3}),
+        ])
+        for series in [series_set.sum_series(), series_set.mean_series()] + series_set.percentile_series([50]):
+            self.assertEqual(series.original_key(series.keys()[0]), start)
+
+    def test_series_list(self):
+        "Changing the series list directly should still refresh cached results"
+        a, b = self.createSeriesSet()
+        series_set = SeriesSet([a])
+        self.assertEqual(series_set.sum(), 9)
+        series_set.series.append(b)
+        self.assertEqual(series_set.sum(), 49)
+        self.assertEqual(series_set.keys(), [0, 1, 2, 3, 4])
+
+    def test_prepare_once(self):
+        "Series that are already prepared shouldn't be sent out again"
+
+        class CountingExecutor(object):
+            "Remembers how many jobs it's been given"
+            jobs = 0
+            def map(self, function, jobs):
+                self.jobs += len(jobs)
+                return map(function, jobs)
+
+        executor = CountingExecutor()
+        series_set = self.createSeriesSet()
+        a, b = series_set
+        series_set.prepare(executor, downsample=(2,))
+        series_set.prepare(executor, downsample=(2,))
+        self.assertEqual(executor.jobs, 2)
+        b[4] = 40
+        series_set.prepare(executor, downsample=(2,))
+        self.assertEqual(executor.jobs, 4)
+        series_set.prepare(executor, interpolate=False, downsample=(3,))
+        self.assertEqual(executor.jobs, 6)
+        series_set.prepare(executor, interpolate=False)
+        self.assertEqual(executor.jobs, 6)
+
+    def test_values_at(self):
+        "Only the latest grid's values should be kept"
+        series_set = self.createSeriesSet()
+        a, b = series_set
+        grid = series_set.key_grid()
+        values = b.values_at(grid)
+        self.assert_(b.values_at(grid) is values)
+        self.assertEqual(list(b.values_at((0, 4))), [10, 30])
+        self.assertEqual(b._grid_values[1], (0, 4))
+        self.assertEqual(list(b.values_at(grid)), [10, 10, 20, 30, 30])
+        b[4] = 40
+        self.assertEqual(list(b.values_at(grid)), [10, 10, 20, 30, 40])
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_matrix(self):
+        "The dense matrix should have a row per key and a column per series"
+        keys, matrix = self.createSeriesSet().as_matrix()
+        self.assertEqual(keys, [0, 1, 2, 3, 4])
+        self.assertEqual(matrix.shape, (5, 2))
+        self.assertEqual(matrix[:, 1].tolist(), [10, 10, 20, 30, 30])
+
+
+
+class NodeSetTest(unittest.TestCase):
+
+    def test_adjacency(self):
+        "Adjacent nodes should come out in link order"
+        nodeset = NodeSet()
+        a, b, c = Node(1), Node(2), Node(3)
+        self.assertEqual([nodeset.add_node(node) for node in (a, b, c)], [0, 1, 2])
+        ab = NodeLink(a, b)
+        ca = NodeLink(c, a)
+        aa = NodeLink(a, a)
+        for link in (ab, ca, aa):
+            nodeset.add_link(link)
+        self.assertEqual(list(nodeset.adjacent_to(a)), [(b, ab), (c, ca), (a, aa)])
+        self.assertEqual(list(nodeset.adjacent_to(a, False)), [(b, ab), (a, aa)])
+        self.assertEqual(list(nodeset.adjacent_to(b)), [(a, ab)])
+        self.assertEqual(nodeset.id_of(c), 2)
+        self.assertRaises(AssertionError, nodeset.add_link, NodeLink(a, Node(4)))
+        self.assertRaises(AttributeError, setattr, a, "colour", "#fff")
+        a.left = 0.5
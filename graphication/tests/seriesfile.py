@@ -0,0 +1,74 @@
+import os
+import unittest
+import tempfile
+import datetime
+
+from graphication.series import Series
+from graphication.seriesfile import write_series, open_series, MappedColumn
+
+class SeriesFileTest(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(".series")
+        os.close(handle)
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def test_round_trip(self):
+        "Series should come back out of files the same as they went in"
+        series = Series("Test Series", {
+            1: 4.5,
+            2.5: 5,
+            88: 4.25,
+            -4: 3,
+            7: 12.125,
+        }, "#336699", {0: Series.STYLE_DASHED})
+        write_series(series, self.filename)
+        mapped = open_series(self.filename)
+        self.assert_(isinstance(mapped.columns()[0], MappedColumn))
+        self.assertEqual(mapped.title, "Test Series")
+        self.assertEqual(mapped.color, "336699")
+        self.assertEqual(mapped.styles, {0: Series.STYLE_DASHED})
+        self.assertEqual(mapped.items(), series.items())
+        self.assertEqual(mapped.key_range(), (-4, 88))
+        self.assertEqual(mapped.value_range(), (3, 12.125))
+        self.assertEqual(mapped.sum(), series.sum())
+        self.assertEqual(mapped.interpolate(0), 4.2)
+        self.assertEqual(mapped[7], 12.125)
+
+    def test_dates(self):
+        "Date keys should come back as timestamps that remember they were dates"
+        start = datetime.date(2008, 1, 1)
+        write_series(Series("Dated", {start: 1, start + datetime.timedelta(1): 2}), self.filename)
+        mapped = open_series(self.filename)
+        self.assertEqual(mapped.key_type, datetime.date)
+        self.assertEqual(mapped.original_key(mapped.keys()[0]), start)
+        self.assertEqual(mapped[start], 1)
+
+    def test_slicing(self):
+        "Slicing a mapped column shouldn't copy it"
+        write_series(Series("Range", dict([(i, i * 2) for i in range(10)])), self.filename)
+        keys, values = open_series(self.filename).columns()
+        part = values[2:5]
+        self.assert_(isinstance(part, MappedColumn))
+        self.assert_(part.buffer is values.buffer)
+        self.assertEqual(list(part), [4, 6, 8])
+        self.assertEqual(values[-1], 18)
+        self.assertRaises(IndexError, values.__getitem__, 10)
+
+    def test_bad_file(self):
+        "Files that aren't series files should be rejected"
+        fo = open(self.filename, "wb")
+        fo.write("Not a series file at all, no sir")
+        fo.close()
+        self.assertRaises(ValueError, open_series, self.filename)
+
+    def test_truncated_file(self):
+        "Empty and cut-short files should be rejected, without a struct.error"
+        for size in [0, 10, 100]:
+            write_series(Series("Range", dict([(i, i * 2) for i in range(10)])), self.filename)
+            fo = open(self.filename, "r+b")
+            fo.truncate(size)
+            fo.close()
+            self.assertRaises(ValueError, open_series, self.filename)
@@ -6,7 +6,7 @@ from graphication.scales import SimpleScale, VerticalWavegraphScale
 
 class WaveGraph(object):
 	
-	def __init__(self, series_set, scale, style=None, label_curves=True, vertical_scale=False, debug=False, textfix=False):
+	def __init__(self, series_set, scale, style=None, label_curves=True, vertical_scale=False, debug=False, textfix=False, sparse=False, executor=None):
 		
 		"""
 		Constructor; creates a new WaveGraph.
@@ -25,9 +25,16 @@ class WaveGraph(object):
 		
 		@param vertical_axis: If a vertical scale should be drawn on the graph
 		@type vertical_axis: bool
+		
+		@param sparse: If each series should only be stacked over its own span of keys, rather than extended across the whole graph. Good for lots of short-lived series.
+		@type sparse: bool
+		
+		@param executor: A pool (anything with a map method) to prepare the series on in parallel; see SeriesSet.prepare.
 		"""
 		
 		self.series_set = series_set
+		self.sparse = sparse
+		self.executor = executor
 		self.style = default_css.merge(style)
 		self.scale = scale
 		self.debug = debug
@@ -42,30 +49,30 @@ class WaveGraph(object):
 		
 		"""Calculates the relative shapes of the sections"""
 		
+		self.data_version = self.series_set.version
+		
 		# Get the style stuff
 		y_offset = self.style['wavegraph'].get_align("vertical-align", 0.5)
 		y_size = self.style['wavegraph'].get_align("height", 0.9)
 		
+		if self.executor is not None:
+			self.series_set.prepare(self.executor, interpolate=not self.sparse)
+		
 		# Work out our extents
-		y_total = max([total for (key, total) in self.series_set.totals()])
+		stack_offsets = self.series_set.stack_offsets(self.sparse)
+		y_total = max([offsets[-1] for (key, offsets) in stack_offsets])
 		self.y_scale = VerticalWavegraphScale(0, y_total)
 		
 		# Calculate the points
 		cols = []
 		self.xs = []
 		
-		for x, stack in self.series_set.stacks():
+		for x, offsets in stack_offsets:
 			self.xs.append(self.scale.get_point(x))
 			
 			# Collect the points
-			ys = []
-			total = 0
-			for ser, val in stack:
-				y = self.y_scale.get_point(val) * y_size
-				ys.append(total)
-				total += y
-			ys.append(total)
-			shift = 1 - total
+			ys = [self.y_scale.get_point(offset) * y_size for offset in offsets]
+			shift = 1 - ys[-1]
 			
 			# Shift them down to center them
 			ys = map(lambda a: a + (shift * y_offset), ys)
@@ -76,6 +83,9 @@ class WaveGraph(object):
 	
 	
 	def set_size(self, width, height):
+		# Catch up with any points appended since we were created
+		if self.series_set.version != self.data_version:
+			self.calc_rel_points()
 		self.width = width
 		self.height = height
 		self.calc_plot_height()